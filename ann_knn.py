@@ -0,0 +1,150 @@
+# Approximate nearest-neighbour KNN for the label scripts.
+#
+# The scripts evaluate KNeighborsClassifier with exact tree or brute-force search
+# and grid-search n_neighbors 1-29, leaf_size 1-49 and p in {1, 2}.  leaf_size
+# only changes the speed of the exact trees, never the neighbours found, and the
+# 29 nearest neighbours of a row contain the k nearest for every smaller k.
+# IVFIndex therefore clusters the training rows once with k-means (an inverted
+# file index) and answers a query by exact search in the few clusters whose
+# centroids are closest to it.  ANNKNeighborsClassifier queries the largest k
+# once and derives the vote of every smaller k from cumulative class counts.
+#
+# Usage (prints the validation accuracy of every k and p from one sweep):
+#     python ann_knn.py
+
+import numpy as np
+from scipy.spatial.distance import cdist
+from sklearn.base import BaseEstimator, ClassifierMixin
+from sklearn.cluster import KMeans
+from sklearn.metrics import accuracy_score
+from sklearn.model_selection import check_cv
+
+# Minkowski p of the scripts' grid and the matching scipy metric
+METRICS = {1: 'cityblock', 2: 'euclidean'}
+
+
+class IVFIndex:
+    """Inverted file index: k-means cells over the training rows, searched exactly in the closest ``n_probe`` cells."""
+
+    def __init__(self, n_lists=None, n_probe=8, random_state=0):
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.random_state = random_state
+
+    def fit(self, X):
+        self.X_ = np.ascontiguousarray(X, dtype=np.float64)
+        n_lists = self.n_lists or max(1, int(np.sqrt(len(self.X_))))
+        kmeans = KMeans(n_clusters=min(n_lists, len(self.X_)), n_init=1, random_state=self.random_state).fit(self.X_)
+        self.centroids_ = kmeans.cluster_centers_
+        self.lists_ = [np.flatnonzero(kmeans.labels_ == i) for i in range(len(self.centroids_))]
+        return self
+
+    def kneighbors(self, X, n_neighbors, p=2):
+        """Return the distances and training positions of the ``n_neighbors`` nearest rows, nearest first."""
+        X = np.asarray(X, dtype=np.float64)
+        metric = METRICS[p]
+        n_probe = min(self.n_probe, len(self.centroids_))
+        probes = np.argpartition(cdist(X, self.centroids_), n_probe - 1, axis=1)[:, :n_probe]
+
+        distances = np.full((len(X), n_neighbors), np.inf)
+        indices = np.full((len(X), n_neighbors), -1, dtype=np.intp)
+        for cell, members in enumerate(self.lists_):
+            queries = np.flatnonzero((probes == cell).any(axis=1))
+            if len(queries) == 0 or len(members) == 0:
+                continue
+            # Merge the cell's rows into the running top k of the queries that probe it
+            cell_distances = np.hstack([distances[queries], cdist(X[queries], self.X_[members], metric=metric)])
+            cell_indices = np.hstack([indices[queries], np.broadcast_to(members, (len(queries), len(members)))])
+            keep = np.argpartition(cell_distances, n_neighbors - 1, axis=1)[:, :n_neighbors]
+            distances[queries] = np.take_along_axis(cell_distances, keep, axis=1)
+            indices[queries] = np.take_along_axis(cell_indices, keep, axis=1)
+
+        order = np.argsort(distances, axis=1, kind='stable')
+        return np.take_along_axis(distances, order, axis=1), np.take_along_axis(indices, order, axis=1)
+
+
+class ANNKNeighborsClassifier(ClassifierMixin, BaseEstimator):
+    """KNeighborsClassifier with uniform weights over an IVFIndex; a drop-in for the scripts' KNN models."""
+
+    def __init__(self, n_neighbors=5, p=2, n_lists=None, n_probe=8, random_state=0):
+        self.n_neighbors = n_neighbors
+        self.p = p
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.random_state = random_state
+
+    def fit(self, X, y):
+        self.classes_, self.y_ = np.unique(np.asarray(y), return_inverse=True)
+        self.index_ = IVFIndex(self.n_lists, self.n_probe, self.random_state).fit(X)
+        return self
+
+    def predict_sweep(self, X, n_neighbors, p=None):
+        """Return ``{k: predictions}`` for every k in ``n_neighbors`` from one query of the largest k."""
+        n_neighbors = sorted(n_neighbors)
+        _, indices = self.index_.kneighbors(X, n_neighbors[-1], self.p if p is None else p)
+        # Votes of the first k neighbours for every k at once; argmax breaks ties
+        # towards the smallest class, like KNeighborsClassifier
+        neighbour_classes = np.where(indices >= 0, self.y_[indices], -1)
+        votes = np.zeros((len(indices), len(self.classes_)), dtype=np.int64)
+        predictions = {}
+        rows = np.arange(len(indices))
+        for k in range(1, n_neighbors[-1] + 1):
+            observed = neighbour_classes[:, k - 1] >= 0
+            votes[rows[observed], neighbour_classes[observed, k - 1]] += 1
+            if k in n_neighbors:
+                predictions[k] = self.classes_[votes.argmax(axis=1)]
+        return predictions
+
+    def predict(self, X):
+        return self.predict_sweep(X, [self.n_neighbors])[self.n_neighbors]
+
+
+def sweep_scores(X_train, y_train, X_valid, y_valid, n_neighbors=range(1, 30), p=(1, 2), **index_params):
+    """Return the validation accuracy of every (n_neighbors, p) from one index and one query per p."""
+    model = ANNKNeighborsClassifier(**index_params).fit(X_train, y_train)
+    scores = {}
+    for metric_p in p:
+        for k, pred in model.predict_sweep(X_valid, n_neighbors, metric_p).items():
+            scores[k, metric_p] = accuracy_score(y_valid, pred)
+    return scores
+
+
+def cross_val_sweep(X, y, n_neighbors=range(1, 30), p=(1, 2), cv=10, **index_params):
+    """Return the mean cross-validated accuracy of every (n_neighbors, p) and the best pair.
+
+    Replaces a grid search over n_neighbors, leaf_size and p: every fold builds
+    one index and runs one query per p.
+    """
+    X = np.asarray(X)
+    y = np.asarray(y)
+    fold_scores = []
+    for train, test in check_cv(cv, y, classifier=True).split(X, y):
+        fold_scores.append(sweep_scores(X[train], y[train], X[test], y[test], n_neighbors, p, **index_params))
+    scores = {key: np.mean([fold[key] for fold in fold_scores]) for key in fold_scores[0]}
+    best = max(scores, key=lambda key: (scores[key], -key[0]))
+    return scores, {'n_neighbors': best[0], 'p': best[1]}
+
+
+SWEEP_COLUMNS = [('k', 'k', 3, ''), ('p=1', 'p1', 9, '.4f'), ('p=2', 'p2', 9, '.4f')]
+
+
+def main():
+    from label_pipelines import LABELS
+    from reports import label_splits, load_shared, print_table, report_parser
+
+    parser = report_parser('Sweep k and p of the approximate KNN on the label PCA features.', labels=None)
+    parser.add_argument('--label', type=int, default=2, choices=LABELS)
+    parser.add_argument('--n-probe', type=int, default=8)
+    args = parser.parse_args()
+
+    # Sweep on the PCA features of the label pipeline
+    split, = label_splits(load_shared(args), [args.label])
+    pca_train_result, pca_valid_result = split.pca_features(split.fit())
+    scores = sweep_scores(pca_train_result, split.train_label, pca_valid_result, split.valid_label,
+                          n_probe=args.n_probe)
+    rows = [{'k': k, 'p1': scores[k, 1], 'p2': scores[k, 2]} for k in sorted({k for k, _ in scores})]
+    print_table(rows, SWEEP_COLUMNS)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+# Approximate-kernel fast path for the SVC labels.
+#
+# An exact RBF SVC costs between quadratic and cubic time in the number of
+# training rows and predicts in time proportional to its support vectors.
+# ApproximateKernelClassifier maps the rows to an explicit feature space that
+# approximates the RBF kernel (Nystroem or random Fourier features) and trains
+# a linear SVM on it with minibatch SGD.  ``n_components`` trades accuracy for
+# speed: more components approximate the kernel better but cost more per row.
+#
+# Usage (prints the exact vs approximate report for every label):
+#     python approximate_kernel.py --method nystroem --n-components 500 1000 2000
+
+import numpy as np
+from sklearn.base import BaseEstimator, ClassifierMixin
+from sklearn.kernel_approximation import Nystroem, RBFSampler
+from sklearn.linear_model import SGDClassifier
+from sklearn.utils.class_weight import compute_class_weight
+
+from kernel_cache import resolve_gamma
+
+METHODS = ('nystroem', 'rff')
+
+
+class ApproximateKernelClassifier(ClassifierMixin, BaseEstimator):
+    """Linear SVM trained in minibatches on an approximate RBF feature map.
+
+    ``C``, ``gamma`` and ``class_weight`` have the meaning they have for SVC;
+    the SGD regularisation is derived from ``C`` as ``1 / (C * n_samples)``.
+    ``n_components`` and ``n_epochs`` set the accuracy/speed trade-off.
+    """
+
+    def __init__(self, method='nystroem', n_components=1000, C=1.0, gamma='scale', class_weight=None,
+                 batch_size=1024, n_epochs=10, random_state=0):
+        self.method = method
+        self.n_components = n_components
+        self.C = C
+        self.gamma = gamma
+        self.class_weight = class_weight
+        self.batch_size = batch_size
+        self.n_epochs = n_epochs
+        self.random_state = random_state
+
+    def fit(self, X, y):
+        X = np.asarray(X)
+        y = np.asarray(y)
+        if self.method not in METHODS:
+            raise ValueError("Unknown kernel approximation method {!r}, expected one of {}".format(self.method, METHODS))
+
+        self.gamma_ = resolve_gamma(self.gamma, X)
+        n_components = min(self.n_components, X.shape[0]) if self.method == 'nystroem' else self.n_components
+        if self.method == 'nystroem':
+            self.feature_map_ = Nystroem(kernel='rbf', gamma=self.gamma_, n_components=n_components,
+                                         random_state=self.random_state)
+        else:
+            self.feature_map_ = RBFSampler(gamma=self.gamma_, n_components=n_components,
+                                           random_state=self.random_state)
+        self.feature_map_.fit(X)
+
+        # partial_fit does not accept class_weight='balanced', so resolve the weights here
+        self.classes_ = np.unique(y)
+        class_weight = self.class_weight
+        if class_weight == 'balanced':
+            class_weight = dict(zip(self.classes_, compute_class_weight('balanced', classes=self.classes_, y=y)))
+
+        # Averaging the SGD iterates converges far better than the last iterate in few epochs
+        self.linear_ = SGDClassifier(loss='hinge', alpha=1.0 / (self.C * X.shape[0]), average=True,
+                                     class_weight=class_weight, random_state=self.random_state)
+
+        # Map and train one minibatch at a time so the mapped rows never exist all at once
+        rng = np.random.RandomState(self.random_state)
+        for _ in range(self.n_epochs):
+            order = rng.permutation(X.shape[0])
+            for start in range(0, X.shape[0], self.batch_size):
+                batch = order[start:start + self.batch_size]
+                self.linear_.partial_fit(self.feature_map_.transform(X[batch]), y[batch], classes=self.classes_)
+        return self
+
+    def decision_function(self, X):
+        return self.linear_.decision_function(self.feature_map_.transform(np.asarray(X)))
+
+    def predict(self, X):
+        X = np.asarray(X)
+        pred = np.empty(X.shape[0], dtype=self.classes_.dtype)
+        for start in range(0, X.shape[0], self.batch_size):
+            pred[start:start + self.batch_size] = self.linear_.predict(
+                self.feature_map_.transform(X[start:start + self.batch_size]))
+        return pred
+
+
+EXACT_COLUMNS = [
+    ('label', 'label', 5, ''), ('model', 'model', 9, ''), ('n_components', 'n_components', 12, ''),
+    ('accuracy', 'accuracy', 9, '.4f'), ('fit (s)', 'fit_seconds', 10, '.3f'),
+    ('predict (s)', 'predict_seconds', 12, '.3f'),
+]
+
+
+def compare_with_exact(shared, labels, method='nystroem', n_components=(500, 1000, 2000)):
+    """Return one row per label and setting comparing the exact SVC with its approximation.
+
+    Both models are trained on the same PCA representation, produced by the
+    label's exact pipeline, and scored on the validation rows with an observed label.
+    """
+    from label_pipelines import LABEL_CONFIGS, make_model
+    from reports import label_splits, timed
+
+    rows = []
+    for split in label_splits(shared, labels):
+        pipeline, fit_time = timed(split.fit)
+        pca_train_result, pca_valid_result = split.pca_features(pipeline)
+        accuracy, predict_time = timed(split.accuracy, pipeline.model, pca_valid_result)
+        rows.append({'label': split.label, 'model': 'exact', 'n_components': None, 'accuracy': accuracy,
+                     'fit_seconds': fit_time, 'predict_seconds': predict_time})
+
+        for components in n_components:
+            approximation = {'method': method, 'n_components': components}
+            model = make_model(dict(LABEL_CONFIGS[split.label], approximation=approximation))
+            _, fit_time = timed(model.fit, pca_train_result, split.train_label)
+            accuracy, predict_time = timed(split.accuracy, model, pca_valid_result)
+            rows.append({'label': split.label, 'model': method, 'n_components': components, 'accuracy': accuracy,
+                         'fit_seconds': fit_time, 'predict_seconds': predict_time})
+    return rows
+
+
+def main():
+    from reports import load_shared, print_table, report_parser
+
+    parser = report_parser('Compare the exact SVCs with their kernel approximations.')
+    parser.add_argument('--method', default='nystroem', choices=METHODS)
+    parser.add_argument('--n-components', type=int, nargs='+', default=[500, 1000, 2000])
+    args = parser.parse_args()
+
+    print_table(compare_with_exact(load_shared(args), args.labels, args.method, args.n_components), EXACT_COLUMNS)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+# Chunked, parallel prediction with bounded memory.
+#
+# A kernel model evaluates an (n_rows x n_support_vectors) block, so predicting a
+# whole test matrix or a large CSV batch at once allocates memory in proportion
+# to the input.  BatchPredictor splits every batch of rows into chunks of
+# ``chunk_size`` rows, predicts them on a thread or process pool and yields the
+# predictions in input order.  At most ``max_pending`` chunks are in flight, so
+# memory stays bounded by the chunk size and the pool width whatever the number
+# of rows.  The model is anything with a ``predict`` method: a LabelPipeline, or
+# a ModelSet predicting every label of a chunk at once.
+#
+# Threads share the model and suit libsvm and BLAS, which release the GIL;
+# processes receive one copy of the model when they start.  The pool splits the
+# available cores between its workers: each worker's BLAS calls are limited to
+# its share of them, so n_jobs workers never start n_jobs x n_cores threads.
+
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from threadpoolctl import threadpool_limits
+
+EXECUTORS = ('thread', 'process')
+
+# The model and BLAS limit of a process pool worker, set once by its initializer
+_worker_model = None
+_worker_limits = None
+
+
+def _init_worker(model, blas_threads):
+    global _worker_model, _worker_limits
+    _worker_model = model
+    _worker_limits = threadpool_limits(limits=blas_threads)
+
+
+def _predict_in_worker(chunk):
+    return _worker_model.predict(chunk)
+
+
+def iter_chunks(batch, chunk_size):
+    """Yield consecutive row chunks of a DataFrame or array, as views where possible."""
+    rows = batch.iloc if isinstance(batch, pd.DataFrame) else batch
+    for start in range(0, len(batch), chunk_size):
+        yield rows[start:start + chunk_size]
+
+
+class BatchPredictor:
+    """Predicts row chunks on a pool with a bounded number of chunks in flight; use it as a context manager."""
+
+    def __init__(self, model, chunk_size=1024, n_jobs=None, executor='thread', max_pending=None):
+        if executor not in EXECUTORS:
+            raise ValueError("Unknown executor {!r}, expected one of {}".format(executor, EXECUTORS))
+        self.model = model
+        self.chunk_size = chunk_size
+        self.n_jobs = n_jobs or len(os.sched_getaffinity(0))
+        self.executor = executor
+        self.max_pending = max_pending or 2 * self.n_jobs
+        self._pool = None
+        self._limits = None
+
+    @property
+    def blas_threads(self):
+        """BLAS threads of every worker: its share of the cores available to this process."""
+        return max(1, len(os.sched_getaffinity(0)) // self.n_jobs)
+
+    def __enter__(self):
+        if self.executor == 'thread':
+            # The limit is process-wide, so it is set once for all threads of the pool
+            self._limits = threadpool_limits(limits=self.blas_threads)
+            self._pool = ThreadPoolExecutor(max_workers=self.n_jobs)
+        else:
+            self._pool = ProcessPoolExecutor(max_workers=self.n_jobs, initializer=_init_worker,
+                                             initargs=(self.model, self.blas_threads))
+        return self
+
+    def __exit__(self, *exc_info):
+        self._pool.shutdown(cancel_futures=True)
+        self._pool = None
+        if self._limits is not None:
+            self._limits.restore_original_limits()
+            self._limits = None
+
+    def _submit(self, chunk):
+        if self.executor == 'thread':
+            return self._pool.submit(self.model.predict, chunk)
+        return self._pool.submit(_predict_in_worker, chunk)
+
+    def iter_predict(self, batches):
+        """Yield ``(chunk, predictions)`` for every chunk of an iterable of batches, in input order."""
+        pending = deque()
+        for batch in batches:
+            for chunk in iter_chunks(batch, self.chunk_size):
+                if len(pending) >= self.max_pending:
+                    done_chunk, future = pending.popleft()
+                    yield done_chunk, future.result()
+                pending.append((chunk, self._submit(chunk)))
+        while pending:
+            done_chunk, future = pending.popleft()
+            yield done_chunk, future.result()
+
+    def predict(self, features):
+        """Return the predictions of every row of ``features``, concatenated in order."""
+        predictions = [prediction for _, prediction in self.iter_predict([features])]
+        if not predictions:
+            return self.model.predict(features)
+        if isinstance(predictions[0], pd.DataFrame):
+            return pd.concat(predictions, ignore_index=True)
+        return np.concatenate(predictions)
+
+
+def predict_chunked(model, features, chunk_size=1024, n_jobs=None, executor='thread'):
+    """Predict ``features`` with ``model`` in chunks on a pool; see BatchPredictor."""
+    with BatchPredictor(model, chunk_size, n_jobs, executor) as predictor:
+        return predictor.predict(features)
@@ -0,0 +1,208 @@
+# Stage benchmark of the label 1-4 pipelines on synthetic layer-7 data.
+#
+# For every (rows, columns) scale a synthetic dataset shaped like the layer-7
+# embeddings is written to a temporary directory: low-rank correlated features
+# with a few null values, 60 speaker ids, ages with missing values, a binary
+# gender and an imbalanced accent label.  Each label pipeline then runs stage by
+# stage - CSV load, fillna, corr, correlated-feature pruning, corrwith, scaling,
+# PCA, SVC fit, predict and CSV export - and the wall time and peak traced
+# memory of every stage are written to a JSON file, so runs before and after a
+# change can be compared.
+#
+# Usage:
+#     python benchmark.py [--rows 1000 4000] [--columns 256 768] [--output benchmark_results.json]
+
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+import sklearn
+from sklearn.metrics import accuracy_score
+
+from feature_selection import SelectionPlan, correlation_with_target, find_correlated_features
+from imputation import MeanImputer, labelled_rows
+from label_pipelines import LABEL_CONFIGS, LABELS, SCALERS, make_model
+from pca_backends import fit_pca
+from reports import print_table
+from shared_preprocessing import N_LABELS
+
+STAGES = ('load', 'fillna', 'corr', 'prune', 'corrwith', 'scale', 'pca', 'fit', 'predict', 'to_csv')
+
+# Number of classes of the synthetic speaker and accent labels
+N_SPEAKERS = 60
+N_ACCENTS = 14
+
+
+def make_dataset(n_rows, n_features, directory, seed=0):
+    """Write a synthetic train/valid/test split with the layer-7 layout and return the three paths."""
+    rng = np.random.default_rng(seed)
+    rank = min(32, n_features)
+    mixing = rng.normal(size=(rank, n_features))
+    speaker_centres = rng.normal(size=(N_SPEAKERS, rank))
+
+    def make_split(n, test=False):
+        speakers = rng.integers(N_SPEAKERS, size=n)
+        latent = speaker_centres[speakers] + rng.normal(scale=0.5, size=(n, rank))
+        features = latent @ mixing + 0.3 * rng.normal(size=(n, n_features))
+        features[rng.random(features.shape) < 0.001] = np.nan
+        data = pd.DataFrame(features, columns=['feature_{}'.format(i) for i in range(1, n_features + 1)])
+        if test:
+            data.insert(0, 'ID', np.arange(1, n + 1))
+            return data
+
+        data['label_1'] = speakers + 1
+        ages = np.round(30 + 4 * latent[:, 1]).clip(18, 60)
+        ages[rng.random(n) < 0.05] = np.nan
+        data['label_2'] = ages
+        data['label_3'] = (latent[:, 2] > 0).astype(int)
+        # Most rows share one accent, like the real label 4
+        data['label_4'] = np.where(latent[:, 3] > -0.5, 6, np.digitize(latent[:, 4], np.linspace(-2, 2, N_ACCENTS - 1)))
+        return data
+
+    paths = []
+    for split, n in (('train', n_rows), ('valid', max(n_rows // 5, 100)), ('test', max(n_rows // 5, 100))):
+        path = os.path.join(directory, '{}.csv'.format(split))
+        make_split(n, test=split == 'test').to_csv(path, index=False)
+        paths.append(path)
+    return paths
+
+
+@contextlib.contextmanager
+def measure(records, stage, **fields):
+    """Append the wall time and peak traced memory above the starting point of the block to ``records``."""
+    start_memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        records.append(dict(fields, stage=stage, seconds=seconds, peak_mb=max(peak - start_memory, 0) / 2 ** 20))
+
+
+def benchmark_label(label, train_path, valid_path, test_path, output_dir, **fields):
+    """Run one label pipeline stage by stage and return its stage records and validation accuracy."""
+    config = LABEL_CONFIGS[label]
+    label_column = 'label_{}'.format(label)
+    records = []
+    fields = dict(fields, label=label)
+
+    with measure(records, 'load', **fields):
+        train = pd.read_csv(train_path)
+        valid = pd.read_csv(valid_path)
+        test = pd.read_csv(test_path)
+
+    with measure(records, 'fillna', **fields):
+        feature_names = list(train.columns[:-N_LABELS])
+        imputer = MeanImputer(feature_names).fit(train)
+        for data in (train, valid, test):
+            imputer.transform(data)
+
+        # Train and validate on the rows where the label is observed
+        train_rows = labelled_rows(train[label_column])
+        valid_rows = labelled_rows(valid[label_column])
+        train_label = train[label_column].to_numpy()[train_rows].astype(np.int64)
+        valid_label = valid[label_column].to_numpy()[valid_rows].astype(np.int64)
+
+    with measure(records, 'corr', **fields):
+        correlation_matrix = train[feature_names].corr()
+
+    with measure(records, 'prune', **fields):
+        plan = SelectionPlan(feature_names)
+        plan.drop(find_correlated_features(correlation_matrix, config['correlation_threshold']),
+                  'correlated with another feature')
+
+    with measure(records, 'corrwith', **fields):
+        if config['target_threshold'] is not None:
+            correlation = correlation_with_target(plan.apply(train, train_rows), train_label)
+            plan.keep(np.asarray(plan.columns)[np.abs(correlation) > config['target_threshold']],
+                      'correlated with the label')
+        train_block = plan.apply(train, train_rows)
+
+    with measure(records, 'scale', **fields):
+        scaler = SCALERS[config['scaler']]()
+        standardized = scaler.fit_transform(train_block)
+
+    with measure(records, 'pca', **fields):
+        pca = fit_pca(standardized, config['variance_threshold'], config.get('pca_backend', 'full'))
+        pca_result = pca.transform(standardized)
+
+    with measure(records, 'fit', **fields):
+        model = make_model(config).fit(pca_result, train_label)
+
+    with measure(records, 'predict', **fields):
+        pred = model.predict(pca.transform(scaler.transform(plan.apply(valid, valid_rows))))
+        pred_test = model.predict(pca.transform(scaler.transform(plan.apply(test))))
+
+    with measure(records, 'to_csv', **fields):
+        df = pd.DataFrame({'ID': test['ID'], 'Label {}'.format(label): pred_test})
+        df.to_csv(os.path.join(output_dir, 'label_{}.csv'.format(label)), index=False)
+
+    return records, accuracy_score(valid_label, pred)
+
+
+def run_benchmark(rows, columns, labels=LABELS, seed=0):
+    """Benchmark every label at every (rows, columns) scale and return the results document."""
+    results = []
+    accuracies = []
+    tracemalloc.start()
+    try:
+        for n_rows in rows:
+            for n_features in columns:
+                with tempfile.TemporaryDirectory() as tmp_dir:
+                    paths = make_dataset(n_rows, n_features, tmp_dir, seed)
+                    for label in labels:
+                        records, accuracy = benchmark_label(label, *paths, tmp_dir, rows=n_rows, columns=n_features)
+                        results.extend(records)
+                        accuracies.append({'rows': n_rows, 'columns': n_features, 'label': label,
+                                           'accuracy': accuracy})
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'created': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'sklearn': sklearn.__version__,
+        'cpu_count': os.cpu_count(),
+        'seed': seed,
+        'results': results,
+        'accuracies': accuracies,
+    }
+
+
+STAGE_COLUMNS = [
+    ('rows', 'rows', 6, ''), ('columns', 'columns', 7, ''), ('label', 'label', 5, ''), ('stage', 'stage', 9, ''),
+    ('time (s)', 'seconds', 10, '.3f'), ('peak (MB)', 'peak_mb', 10, '.1f'),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time every stage of the label pipelines on synthetic data.')
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 4000])
+    parser.add_argument('--columns', type=int, nargs='+', default=[256, 768])
+    parser.add_argument('--labels', type=int, nargs='+', default=LABELS, choices=LABELS)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='benchmark_results.json')
+    args = parser.parse_args()
+
+    document = run_benchmark(args.rows, args.columns, args.labels, args.seed)
+    with open(args.output, 'w') as f:
+        json.dump(document, f, indent=2)
+
+    print_table(document['results'], STAGE_COLUMNS)
+    print("Results written to {}".format(args.output))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+# Columnar binary format for the layer 7 datasets.
+#
+# Parsing hundreds of float columns from text dominates the start-up time of
+# every label pipeline, so each CSV split is converted once into a directory
+# holding a float32 feature block, the label and ID columns as separate .npy
+# files and a small JSON description.  Loading memory-maps the blocks, so
+# building the shared preprocessing cache skips the CSV parse.  Only that cold
+# build is sped up: the imputed frames it caches are in-memory copies, and the
+# label pipelines read those copies (or run_all_labels' shared-memory copies of
+# them), never the mapped blocks.  streaming_stats.py is the one reader that
+# scans the mapped blocks in place, chunk by chunk.
+#
+# Usage:
+#     python binary_dataset.py train.csv /kaggle/working/layer7_binary/train
+
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+# Bump whenever the on-disk layout changes
+FORMAT_VERSION = 1
+
+META_FILE = 'meta.json'
+FEATURES_FILE = 'features.npy'
+LABELS_FILE = 'labels.npy'
+IDS_FILE = 'ids.npy'
+
+ID_COLUMN = 'ID'
+LABEL_PREFIX = 'label_'
+
+
+class BinaryDataset:
+    """A dataset split loaded from the columnar binary format.
+
+    ``features`` is a float32 ``(n_rows, n_features)`` array, ``labels`` a float64
+    ``(n_rows, n_labels)`` array (missing labels are NaN) and ``ids`` the ID column
+    or ``None`` when the split has none.  The arrays are memory-mapped read-only
+    unless the dataset was loaded with ``mmap_mode=None``.
+    """
+
+    def __init__(self, features, labels, ids, meta):
+        self.features = features
+        self.labels = labels
+        self.ids = ids
+        self.meta = meta
+
+    @property
+    def columns(self):
+        return self.meta['columns']
+
+    @property
+    def feature_names(self):
+        return self.meta['feature_columns']
+
+    @property
+    def label_names(self):
+        return self.meta['label_columns']
+
+    @property
+    def source_digest(self):
+        return self.meta['source_digest']
+
+    def __len__(self):
+        return self.meta['n_rows']
+
+    def to_frame(self):
+        """Return the split as a DataFrame with the column order of the source CSV."""
+        frames = [pd.DataFrame(self.features, columns=self.feature_names, copy=False)]
+        if self.label_names:
+            frames.append(pd.DataFrame(self.labels, columns=self.label_names, copy=False))
+        if self.ids is not None:
+            frames.append(pd.DataFrame({ID_COLUMN: self.ids}))
+        return pd.concat(frames, axis=1, copy=False)[self.columns]
+
+
+def is_binary_dataset(path):
+    """Return whether ``path`` is a directory written by :func:`convert_csv`."""
+    return os.path.isfile(os.path.join(path, META_FILE))
+
+
+def split_columns(columns):
+    """Split the column names of a split into its ID, label and feature columns."""
+    id_columns = [c for c in columns if c == ID_COLUMN]
+    label_columns = [c for c in columns if c.startswith(LABEL_PREFIX)]
+    feature_columns = [c for c in columns if c not in id_columns and c not in label_columns]
+    return id_columns, label_columns, feature_columns
+
+
+def _count_rows(csv_path):
+    with open(csv_path, 'rb') as f:
+        return sum(1 for _ in f) - 1
+
+
+def convert_csv(csv_path, out_dir, chunksize=10000):
+    """Convert the CSV split at ``csv_path`` into the binary format under ``out_dir``.
+
+    The CSV is read in chunks of ``chunksize`` rows and written straight into the
+    preallocated blocks, so the conversion never holds the whole split in memory.
+    """
+    from shared_preprocessing import file_digest
+
+    columns = list(pd.read_csv(csv_path, nrows=0).columns)
+    id_columns, label_columns, feature_columns = split_columns(columns)
+    n_rows = _count_rows(csv_path)
+
+    os.makedirs(out_dir, exist_ok=True)
+    features = np.lib.format.open_memmap(os.path.join(out_dir, FEATURES_FILE), mode='w+',
+                                         dtype=np.float32, shape=(n_rows, len(feature_columns)))
+    labels = np.lib.format.open_memmap(os.path.join(out_dir, LABELS_FILE), mode='w+',
+                                       dtype=np.float64, shape=(n_rows, len(label_columns)))
+    ids = None
+    if id_columns:
+        ids = np.lib.format.open_memmap(os.path.join(out_dir, IDS_FILE), mode='w+',
+                                        dtype=np.int64, shape=(n_rows,))
+
+    # Copy each chunk into its slice of the blocks
+    start = 0
+    for chunk in pd.read_csv(csv_path, chunksize=chunksize):
+        stop = start + len(chunk)
+        features[start:stop] = chunk[feature_columns].to_numpy(dtype=np.float32)
+        labels[start:stop] = chunk[label_columns].to_numpy(dtype=np.float64)
+        if ids is not None:
+            ids[start:stop] = chunk[ID_COLUMN].to_numpy(dtype=np.int64)
+        start = stop
+
+    for block in (features, labels, ids):
+        if block is not None:
+            block.flush()
+
+    meta = {
+        'version': FORMAT_VERSION,
+        'n_rows': n_rows,
+        'columns': columns,
+        'feature_columns': feature_columns,
+        'label_columns': label_columns,
+        'has_ids': ids is not None,
+        'source_digest': file_digest(csv_path),
+    }
+    # Write the description last so a partially converted directory is never loaded
+    with open(os.path.join(out_dir, META_FILE), 'w') as f:
+        json.dump(meta, f)
+
+    return meta
+
+
+def load_binary_dataset(path, mmap_mode='r'):
+    """Load a split written by :func:`convert_csv`, memory-mapping its blocks by default."""
+    with open(os.path.join(path, META_FILE)) as f:
+        meta = json.load(f)
+    if meta['version'] != FORMAT_VERSION:
+        raise ValueError("Unsupported binary dataset version {} in {}".format(meta['version'], path))
+
+    features = np.load(os.path.join(path, FEATURES_FILE), mmap_mode=mmap_mode)
+    labels = np.load(os.path.join(path, LABELS_FILE), mmap_mode=mmap_mode)
+    ids = np.load(os.path.join(path, IDS_FILE), mmap_mode=mmap_mode) if meta['has_ids'] else None
+
+    return BinaryDataset(features, labels, ids, meta)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert a layer 7 CSV split into the columnar binary format.')
+    parser.add_argument('csv_path')
+    parser.add_argument('out_dir')
+    parser.add_argument('--chunksize', type=int, default=10000)
+    args = parser.parse_args()
+
+    meta = convert_csv(args.csv_path, args.out_dir, chunksize=args.chunksize)
+    print("Converted {} rows with {} features and {} labels into {}".format(
+        meta['n_rows'], len(meta['feature_columns']), len(meta['label_columns']), args.out_dir))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+# Feature rankers for the label pipelines.
+#
+# The label scripts keep the features whose Pearson correlation with the label
+# exceeds a hand-set threshold, a poor signal for categorical labels such as the
+# speaker ID.  A ranker scores every feature against the label and the pipeline
+# keeps the ``top_k`` best, set in the label config:
+#
+#   correlation  absolute Pearson correlation, the scripts' signal
+#   mutual_info  mutual information between each feature and the label
+#   anova_f      ANOVA F statistic of each feature across the label classes
+#   tree         impurity importance of an extremely randomized trees forest
+#
+# Mutual information and ANOVA F score every column independently, so the
+# columns are split into one chunk per core and scored in parallel.  The forest
+# grows its trees in parallel instead.  ``top_k`` is a number of features, or a
+# fraction below 1 of the total score the kept features must reach.
+#
+# Usage (prints the selected and PCA widths, fit and predict times and accuracy per ranker):
+#     python feature_ranking.py [--top-k K] [--rankers mutual_info tree]
+
+import numpy as np
+from joblib import Parallel, delayed, effective_n_jobs
+from sklearn.ensemble import ExtraTreesClassifier
+from sklearn.feature_selection import f_classif, mutual_info_classif
+
+from feature_selection import correlation_with_target
+
+RANKERS = ('correlation', 'mutual_info', 'anova_f', 'tree')
+
+
+def _mutual_info(features, labels, random_state):
+    return mutual_info_classif(features, labels, random_state=random_state)
+
+
+def _anova_f(features, labels, random_state):
+    return f_classif(features, labels)[0]
+
+
+COLUMN_SCORERS = {
+    'mutual_info': _mutual_info,
+    'anova_f': _anova_f,
+}
+
+
+def score_features(features, labels, ranker, n_jobs=-1, random_state=0):
+    """Return the score of every column of ``features`` for ``labels``; higher is more relevant."""
+    features = np.asarray(features, dtype=np.float64)
+    labels = np.asarray(labels)
+    if ranker == 'correlation':
+        scores = np.abs(correlation_with_target(features, labels))
+    elif ranker == 'tree':
+        forest = ExtraTreesClassifier(n_estimators=100, n_jobs=n_jobs, random_state=random_state)
+        scores = forest.fit(features, labels).feature_importances_
+    elif ranker in COLUMN_SCORERS:
+        # Score one chunk of columns per core
+        chunks = np.array_split(np.arange(features.shape[1]), min(effective_n_jobs(n_jobs), features.shape[1]))
+        scorer = COLUMN_SCORERS[ranker]
+        scores = np.concatenate(Parallel(n_jobs=len(chunks))(
+            delayed(scorer)(features[:, chunk], labels, random_state) for chunk in chunks))
+    else:
+        raise ValueError("Unknown ranker {!r}, expected one of {}".format(ranker, RANKERS))
+    # Constant columns have no score
+    return np.nan_to_num(scores, nan=0.0)
+
+
+def top_features(scores, top_k):
+    """Return the positions of the best ``top_k`` scores in column order.
+
+    A ``top_k`` below 1 keeps the fewest best features whose scores add up to
+    that fraction of the total score.
+    """
+    order = np.argsort(-scores, kind='stable')
+    if top_k < 1:
+        cumulative = np.cumsum(scores[order])
+        top_k = int(np.searchsorted(cumulative, top_k * cumulative[-1])) + 1
+    return np.sort(order[:min(int(top_k), len(scores))])
+
+
+RANKER_COLUMNS = [
+    ('label', 'label', 5, ''), ('ranker', 'ranker', 12, ''), ('features', 'n_features', 9, ''),
+    ('components', 'n_components', 11, ''), ('fit (s)', 'fit_seconds', 8, '.3f'),
+    ('svc fit (s)', 'svc_fit_seconds', 12, '.3f'), ('predict (s)', 'predict_seconds', 12, '.3f'),
+    ('accuracy', 'accuracy', 9, '.4f'),
+]
+
+
+def compare_rankers(shared, labels, rankers=RANKERS, top_k=0.9, n_jobs=-1):
+    """Return one row per label and selection rule with the selected and PCA widths, timings and accuracy.
+
+    ``fit_seconds`` covers the whole pipeline fit, ranking included, and
+    ``svc_fit_seconds`` the SVC alone.  The first row of every label uses the
+    selection of its label script.
+    """
+    from label_pipelines import LABEL_CONFIGS, make_model
+    from reports import label_splits, timed
+
+    rows = []
+    for split in label_splits(shared, labels):
+        for ranker in ('script',) + tuple(rankers):
+            config = dict(LABEL_CONFIGS[split.label])
+            if ranker != 'script':
+                config.update(ranker=ranker, top_k=top_k, ranker_jobs=n_jobs)
+            pipeline, fit_time = timed(split.fit, config)
+
+            # Time the SVC alone on the PCA features of the selection
+            pca_train_result, _ = split.pca_features(pipeline)
+            _, svc_fit_time = timed(make_model(config).fit, pca_train_result, split.train_label)
+            accuracy, predict_time = timed(split.accuracy, pipeline, split.valid_features)
+
+            rows.append({'label': split.label, 'ranker': ranker, 'n_features': len(pipeline.feature_indices),
+                         'n_components': pipeline.pca.n_components_, 'fit_seconds': fit_time,
+                         'svc_fit_seconds': svc_fit_time, 'predict_seconds': predict_time,
+                         'accuracy': accuracy})
+    return rows
+
+
+def main():
+    from reports import load_shared, print_table, report_parser
+
+    parser = report_parser('Compare the feature rankers on every label pipeline.')
+    parser.add_argument('--rankers', nargs='+', default=list(RANKERS), choices=RANKERS)
+    parser.add_argument('--top-k', type=float, default=0.9,
+                        help='features to keep, or a fraction below 1 of the total score')
+    parser.add_argument('--n-jobs', type=int, default=-1)
+    args = parser.parse_args()
+
+    rows = compare_rankers(load_shared(args), args.labels, args.rankers, args.top_k, args.n_jobs)
+    print_table(rows, RANKER_COLUMNS)
+
+if __name__ == '__main__':
+    main()
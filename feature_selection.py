@@ -0,0 +1,115 @@
+# Feature selection helpers shared by the label 1-4 pipelines.
+
+import numpy as np
+import pandas as pd
+
+
+def find_correlated_features(correlation_matrix, correlation_threshold, columns=None):
+    """Return the features that are highly correlated with an earlier feature.
+
+    A feature is selected when the absolute correlation with any feature before it
+    exceeds ``correlation_threshold``, which is the rule of the original
+    ``for i ... for j in range(i)`` loop of the label scripts.  The check runs on
+    the strictly lower triangle of the NumPy correlation array, and the features
+    are returned as a list in column order so the result is deterministic.
+
+    ``correlation_matrix`` is a square DataFrame or array; ``columns`` names the
+    features of an array and defaults to the DataFrame columns.
+    """
+    if isinstance(correlation_matrix, pd.DataFrame):
+        if columns is None:
+            columns = correlation_matrix.columns
+        correlation_matrix = correlation_matrix.to_numpy()
+
+    # NaN correlations (constant features) never exceed the threshold
+    with np.errstate(invalid='ignore'):
+        above_threshold = np.abs(correlation_matrix) > correlation_threshold
+    correlated = np.tril(above_threshold, k=-1).any(axis=1)
+
+    return [columns[i] for i in np.flatnonzero(correlated)]
+
+
+def correlation_with_target(features, target):
+    """Return the Pearson correlation of every column of ``features`` with ``target``.
+
+    Equivalent to ``DataFrame.corrwith(target)`` for data without null values, but
+    computed with one matrix-vector product on the NumPy block.
+    """
+    features = np.asarray(features, dtype=np.float64)
+    target = np.asarray(target, dtype=np.float64)
+
+    centred_features = features - features.mean(axis=0)
+    centred_target = target - target.mean()
+    covariance = centred_features.T @ centred_target
+    norms = np.sqrt(np.einsum('ij,ij->j', centred_features, centred_features) * (centred_target @ centred_target))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return covariance / norms
+
+
+class SelectionPlan:
+    """Drop and keep decisions on the feature columns, applied to a dataset with one column gather.
+
+    The label scripts used to drop columns from train, valid and test one step at
+    a time, materialising a new DataFrame per step and split.  A plan only records
+    the decisions; ``apply`` then takes the remaining columns of a DataFrame or
+    NumPy block at once, so each split is copied a single time.
+    """
+
+    def __init__(self, feature_names):
+        self.feature_names = list(feature_names)
+        self.indices = np.arange(len(self.feature_names), dtype=np.intp)
+        self.steps = []
+
+    @property
+    def columns(self):
+        """Names of the features the plan keeps, in column order."""
+        return [self.feature_names[i] for i in self.indices]
+
+    @property
+    def n_features(self):
+        return len(self.indices)
+
+    def drop(self, features, reason):
+        """Record that ``features`` are removed because of ``reason``."""
+        features = set(features)
+        return self._record('drop', reason, [self.feature_names[i] not in features for i in self.indices])
+
+    def keep(self, features, reason):
+        """Record that only ``features`` are kept because of ``reason``."""
+        features = set(features)
+        return self._record('keep', reason, [self.feature_names[i] in features for i in self.indices])
+
+    def _record(self, action, reason, kept):
+        kept = np.asarray(kept, dtype=bool).reshape(-1)
+        self.steps.append({
+            'action': action,
+            'reason': reason,
+            'dropped': [self.feature_names[i] for i in self.indices[~kept]],
+        })
+        self.indices = self.indices[kept]
+        return self
+
+    def apply(self, data, rows=None):
+        """Return the kept feature columns of a DataFrame (found by name) or a feature block as one NumPy array.
+
+        ``rows`` optionally selects rows by position, in the same gather.
+        """
+        rows = slice(None) if rows is None else np.asarray(rows)
+        if isinstance(data, pd.DataFrame):
+            positions = data.columns.get_indexer(self.columns)
+            if (positions < 0).any():
+                raise KeyError("Columns missing from the dataset: {}".format(
+                    [name for name, position in zip(self.columns, positions) if position < 0]))
+            # iloc with position arrays is a single take on each dtype block of the frame
+            return data.iloc[rows, positions].to_numpy()
+        if isinstance(rows, slice):
+            return np.take(data, self.indices, axis=1)
+        return data[np.ix_(rows, self.indices)]
+
+    def target_correlation(self, data, target, rows=None):
+        """Return the correlation of every kept feature with ``target`` as a Series, like ``corrwith``."""
+        return pd.Series(correlation_with_target(self.apply(data, rows), target), index=self.columns)
+
+    def decisions(self):
+        """Return the reason that removed every dropped feature."""
+        return {name: step['reason'] for step in self.steps for name in step['dropped']}
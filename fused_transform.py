@@ -0,0 +1,58 @@
+# Scaler and PCA of a fitted label pipeline folded into one affine projection.
+#
+# Column selection, RobustScaler/StandardScaler and PCA are all affine, so
+#     pca.transform(scaler.transform(X[:, feature_indices]))
+# equals X @ W + b for a single weight matrix W (zero rows for the dropped
+# features) and bias b.  Applying them is one float32 GEMM on the raw feature
+# block with no intermediate arrays.
+
+import numpy as np
+
+
+class FusedTransform:
+    """Affine map ``X @ weights + bias`` from raw feature rows to a label's PCA representation."""
+
+    def __init__(self, weights, bias):
+        self.weights = np.ascontiguousarray(weights, dtype=np.float32)
+        self.bias = np.ascontiguousarray(bias, dtype=np.float32)
+
+    @property
+    def n_features(self):
+        return self.weights.shape[0]
+
+    @property
+    def n_components(self):
+        return self.weights.shape[1]
+
+    @classmethod
+    def from_pipeline(cls, pipeline):
+        """Compose the fitted scaler and PCA of a LabelPipeline, in float64, into one projection."""
+        scaler = pipeline.scaler
+        pca = pipeline.pca
+        n_selected = len(pipeline.feature_indices)
+
+        # RobustScaler keeps its offset in center_, StandardScaler in mean_; either may be disabled
+        center = getattr(scaler, 'center_', getattr(scaler, 'mean_', None))
+        center = np.zeros(n_selected) if center is None else np.asarray(center, dtype=np.float64)
+        scale = np.ones(n_selected) if scaler.scale_ is None else np.asarray(scaler.scale_, dtype=np.float64)
+
+        components = pca.components_.T.astype(np.float64)
+        if pca.whiten:
+            components = components / np.sqrt(pca.explained_variance_)
+
+        # ((x - center) / scale - pca.mean_) @ components
+        selected_weights = components / scale[:, None]
+        bias = -(center / scale + pca.mean_) @ components
+
+        weights = np.zeros((len(pipeline.feature_names), components.shape[1]))
+        weights[pipeline.feature_indices] = selected_weights
+        return cls(weights, bias)
+
+    def transform(self, X, out=None):
+        """Project the raw feature rows ``X``, writing into the float32 array ``out`` when given."""
+        X = np.asarray(X, dtype=np.float32)
+        if out is None:
+            out = np.empty((X.shape[0], self.n_components), dtype=np.float32)
+        np.matmul(X, self.weights, out=out)
+        out += self.bias
+        return out
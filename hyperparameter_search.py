@@ -0,0 +1,158 @@
+# Parallel successive-halving hyperparameter search.
+#
+# SuccessiveHalvingSearch is a drop-in replacement for the GridSearchCV calls of
+# the label scripts.  Every round evaluates the remaining candidates with
+# cross-validation on a growing subset of the training rows and keeps the best
+# 1/factor of them, so weak configurations are discarded after cheap fits on
+# small subsets.  The fits of a round are spread across all cores.
+#
+# For RBF SVCs the candidates of a fold that share a gamma are fitted together
+# on a precomputed kernel, so the fold's kernel matrices are computed once per
+# gamma instead of once per C value.
+
+import math
+
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.base import clone, is_classifier
+from sklearn.metrics import accuracy_score
+from sklearn.metrics.pairwise import rbf_kernel
+from sklearn.model_selection import ParameterGrid, check_cv
+from sklearn.svm import SVC
+
+from kernel_cache import resolve_gamma
+
+
+def _kernel_gamma(estimator, params):
+    # Candidates of an RBF SVC share a kernel when they share a gamma
+    if not isinstance(estimator, SVC):
+        return None
+    merged = dict(estimator.get_params(), **params)
+    if merged['kernel'] != 'rbf':
+        return None
+    return merged['gamma']
+
+
+def _fit_and_score_group(estimator, candidates, gamma, X, y, train, test):
+    """Fit every ``(index, params)`` candidate on one fold and return their validation accuracies."""
+    scores = []
+
+    if gamma is None:
+        for index, params in candidates:
+            model = clone(estimator).set_params(**params)
+            model.fit(X[train], y[train])
+            scores.append((index, accuracy_score(y[test], model.predict(X[test]))))
+        return scores
+
+    # Compute the fold's kernel matrices once and reuse them for every C value
+    gamma = resolve_gamma(gamma, X[train])
+    train_kernel = rbf_kernel(X[train], gamma=gamma)
+    test_kernel = rbf_kernel(X[test], X[train], gamma=gamma)
+    for index, params in candidates:
+        model = clone(estimator).set_params(**params).set_params(kernel='precomputed', gamma='scale')
+        model.fit(train_kernel, y[train])
+        scores.append((index, accuracy_score(y[test], model.predict(test_kernel))))
+    return scores
+
+
+class SuccessiveHalvingSearch:
+    """Successive-halving search over ``param_grid`` with parallel, kernel-sharing fits.
+
+    Only the best 1/``factor`` of the candidates survive each round while the
+    number of rows grows by ``factor``.  ``min_resources`` is the number of rows
+    of the first round; by default it is chosen so that the last round uses all
+    rows.  After the search the best candidate is refitted on all rows and
+    exposed, like GridSearchCV, as ``best_params_``, ``best_score_`` and
+    ``best_estimator_``; ``cv_results_`` lists the mean score of every candidate
+    in every round it took part in.
+    """
+
+    def __init__(self, estimator, param_grid, cv=5, factor=3, min_resources=None,
+                 n_jobs=-1, random_state=0, refit=True, verbose=0):
+        self.estimator = estimator
+        self.param_grid = param_grid
+        self.cv = cv
+        self.factor = factor
+        self.min_resources = min_resources
+        self.n_jobs = n_jobs
+        self.random_state = random_state
+        self.refit = refit
+        self.verbose = verbose
+
+    def _schedule(self, n_samples, n_candidates, n_splits, n_classes):
+        # One round per halving until a single candidate is left; counted on integers,
+        # as math.log(125, 5) is 3.0000000000000004 and would add a round
+        n_halvings = 0
+        while self.factor ** n_halvings < n_candidates:
+            n_halvings += 1
+        n_rounds = n_halvings + 1
+        if self.min_resources is not None:
+            return [min(n_samples, self.min_resources * self.factor ** i) for i in range(n_rounds)]
+
+        # Exhaust the rows: the last round uses the whole training set
+        smallest = min(n_samples, 2 * n_splits * n_classes)
+        return [max(smallest, n_samples // self.factor ** (n_rounds - 1 - i)) for i in range(n_rounds)]
+
+    def fit(self, X, y):
+        X = np.asarray(X)
+        y = np.asarray(y)
+        n_samples = X.shape[0]
+        candidates = list(ParameterGrid(self.param_grid))
+        cv = check_cv(self.cv, y, classifier=is_classifier(self.estimator))
+        n_classes = len(np.unique(y))
+
+        # Rounds use growing prefixes of one random row order
+        order = np.random.RandomState(self.random_state).permutation(n_samples)
+        schedule = self._schedule(n_samples, len(candidates), cv.get_n_splits(), n_classes)
+
+        remaining = list(range(len(candidates)))
+        self.cv_results_ = []
+        with Parallel(n_jobs=self.n_jobs) as parallel:
+            for round_index, resources in enumerate(schedule):
+                rows = np.sort(order[:resources])
+                scores = self._evaluate(parallel, candidates, remaining, X[rows], y[rows], cv)
+
+                for index in remaining:
+                    self.cv_results_.append({'round': round_index, 'n_resources': len(rows),
+                                             'params': candidates[index], 'mean_test_score': scores[index]})
+                if self.verbose:
+                    print("Round {}: {} candidates on {} rows, best score {:.4f}".format(
+                        round_index, len(remaining), len(rows), max(scores[i] for i in remaining)))
+
+                # Keep the best 1/factor of the candidates, the earliest one first on ties
+                ranked = sorted(remaining, key=lambda i: (-scores[i], i))
+                if len(ranked) == 1 or resources >= n_samples:
+                    break
+                remaining = ranked[:max(1, math.ceil(len(ranked) / self.factor))]
+
+        best = ranked[0]
+        self.best_index_ = best
+        self.best_params_ = candidates[best]
+        self.best_score_ = scores[best]
+        if self.refit:
+            self.best_estimator_ = clone(self.estimator).set_params(**self.best_params_).fit(X, y)
+        return self
+
+    def _evaluate(self, parallel, candidates, remaining, X, y, cv):
+        # One task per fold and kernel, holding every candidate that shares the kernel
+        groups = {}
+        for index in remaining:
+            gamma = _kernel_gamma(self.estimator, candidates[index])
+            key = ('kernel', gamma) if gamma is not None else ('candidate', index)
+            groups.setdefault(key, (gamma, []))[1].append((index, candidates[index]))
+
+        folds = list(cv.split(X, y))
+        results = parallel(
+            delayed(_fit_and_score_group)(self.estimator, group, gamma, X, y, train, test)
+            for gamma, group in groups.values()
+            for train, test in folds
+        )
+
+        totals = {index: [] for index in remaining}
+        for fold_scores in results:
+            for index, score in fold_scores:
+                totals[index].append(score)
+        return {index: float(np.mean(fold_scores)) for index, fold_scores in totals.items()}
+
+    def predict(self, X):
+        return self.best_estimator_.predict(X)
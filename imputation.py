@@ -0,0 +1,75 @@
+# Mean imputation fitted once on the training features and applied to any split.
+#
+# The label scripts used to fill every split with its own means, so the valid
+# and test rows were imputed with statistics the model never saw in training and
+# the means were computed three times.  MeanImputer accumulates the training
+# means once - in a single pass over a loaded block or chunk by chunk while a
+# large file is streamed - and fills the null features of train, valid, test and
+# live scoring batches in place with those means.  Rows with a missing label are
+# not dropped from the datasets; ``labelled_rows`` returns the rows a label can
+# be trained on, to be gathered together with the selected columns.
+
+import numpy as np
+import pandas as pd
+
+
+class MeanImputer:
+    """Training feature means, accumulated over one or more chunks and used to fill null features in place."""
+
+    def __init__(self, feature_names):
+        self.feature_names = list(feature_names)
+        self.sums_ = np.zeros(len(self.feature_names))
+        self.counts_ = np.zeros(len(self.feature_names), dtype=np.int64)
+
+    @classmethod
+    def from_means(cls, feature_names, means):
+        """Return an imputer holding known training ``means``, e.g. those of a saved model set."""
+        imputer = cls(feature_names)
+        imputer.sums_ = np.asarray(means, dtype=np.float64).copy()
+        imputer.counts_ = np.ones(len(imputer.feature_names), dtype=np.int64)
+        return imputer
+
+    @property
+    def means_(self):
+        # Columns without an observed value have no mean, as with DataFrame.mean()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.counts_ > 0, self.sums_ / self.counts_, np.nan)
+
+    def partial_fit(self, features):
+        """Add a chunk of training rows, given as a DataFrame or as a block of the feature columns."""
+        features = self._block(features)
+        observed = ~np.isnan(features)
+        # Accumulate in float64 whatever the precision of the chunk
+        self.sums_ += np.where(observed, features, 0).sum(axis=0, dtype=np.float64)
+        self.counts_ += observed.sum(axis=0)
+        return self
+
+    def fit(self, features):
+        """Compute the means of the training rows in ``features``."""
+        self.sums_[:] = 0
+        self.counts_[:] = 0
+        return self.partial_fit(features)
+
+    def transform(self, data, copy=False):
+        """Fill the null features of a DataFrame or feature block with the training means, in place by default."""
+        if copy:
+            data = data.copy()
+        means = self.means_
+        if isinstance(data, pd.DataFrame):
+            # Cast every mean to its column's dtype, or pandas upcasts float32 columns with a null to float64
+            dtypes = data.dtypes
+            data.fillna({name: dtypes[name].type(mean) for name, mean in zip(self.feature_names, means)},
+                        inplace=True)
+            return data
+        np.copyto(data, means.astype(data.dtype), where=np.isnan(data))
+        return data
+
+    def _block(self, features):
+        if isinstance(features, pd.DataFrame):
+            return features[self.feature_names].to_numpy()
+        return np.asarray(features)
+
+
+def labelled_rows(labels):
+    """Return the positions of the rows where ``labels`` is observed; the feature block is not touched."""
+    return np.flatnonzero(~np.isnan(np.asarray(labels, dtype=np.float64)))
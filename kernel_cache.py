@@ -0,0 +1,197 @@
+# Cache of RBF kernel matrices shared by SVC fits.
+#
+# For a fixed gamma the RBF Gram matrix of the PCA training features is the
+# same for every C value and for every refit of the final model, so it is
+# computed once, stored in float32 and fed to ``SVC(kernel='precomputed')``.
+# Entries are keyed by a fingerprint of the data and the gamma and evicted in
+# least-recently-used order once the cache exceeds its byte budget.  Only the
+# training side is cached: predictions evaluate the kernel of their rows against
+# the support vectors and combine it with the dual coefficients directly.
+
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+from sklearn.base import BaseEstimator, ClassifierMixin
+from sklearn.metrics.pairwise import rbf_kernel
+from sklearn.svm import SVC
+
+# Default byte budget of a kernel cache (4 GiB)
+DEFAULT_MAX_BYTES = 4 << 30
+
+
+def resolve_gamma(gamma, X):
+    """Return the numeric RBF gamma SVC would use for ``gamma`` on the training rows ``X``."""
+    if gamma == 'scale':
+        variance = X.var()
+        return 1.0 / (X.shape[1] * variance) if variance != 0 else 1.0
+    if gamma == 'auto':
+        return 1.0 / X.shape[1]
+    return float(gamma)
+
+
+def fingerprint(X):
+    """Return a digest identifying the contents, shape and dtype of the array ``X``."""
+    X = np.ascontiguousarray(X)
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(str((X.shape, X.dtype.str)).encode())
+    digest.update(X.view(np.uint8).data)
+    return digest.hexdigest()
+
+
+class KernelCache:
+    """LRU cache of float32 RBF kernel matrices with a byte budget."""
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    # Copies share the cache, so the estimators sklearn clones for a CV or grid
+    # search keep reusing its Gram matrices instead of each copying the budget
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def rbf(self, X, Y=None, gamma='scale'):
+        """Return the RBF kernel between the rows of ``X`` and ``Y`` (``X`` itself when ``Y`` is None).
+
+        A string ``gamma`` is resolved on ``X`` when ``Y`` is None, like SVC does
+        on its training rows; pass a numeric gamma when ``Y`` is given.
+        """
+        gamma = resolve_gamma(gamma, X)
+        key = (fingerprint(X), None if Y is None else fingerprint(Y), gamma)
+
+        kernel = self._entries.get(key)
+        if kernel is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return kernel
+
+        self.misses += 1
+        kernel = rbf_kernel(X, Y, gamma=gamma).astype(np.float32)
+        self._store(key, kernel)
+        return kernel
+
+    def _store(self, key, kernel):
+        # Matrices larger than the whole budget are returned without being cached
+        if kernel.nbytes > self.max_bytes:
+            return
+        while self.nbytes + kernel.nbytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.nbytes -= evicted.nbytes
+        self._entries[key] = kernel
+        self.nbytes += kernel.nbytes
+
+    def clear(self):
+        self._entries.clear()
+        self.nbytes = 0
+
+
+# Cache used by CachedKernelSVC instances that are not given one
+default_cache = KernelCache()
+
+
+def class_pairs(n_classes):
+    """Return the (first, second) class positions of the one-vs-one decision functions, in libsvm order."""
+    return [(i, j) for i in range(n_classes) for j in range(i + 1, n_classes)]
+
+
+def ovo_decision(kernel, svc):
+    """Return the one-vs-one decision values of a fitted SVC, positive for the first class of every pair.
+
+    ``kernel`` holds the kernel of the rows to score against the support vectors
+    of ``svc``, in the order of ``svc.support_``.
+    """
+    dual_coef = svc.dual_coef_
+    if len(svc.classes_) == 2:
+        # The binary coefficients of SVC are signed for the second class
+        return -(kernel @ dual_coef[0] + svc.intercept_[0]).reshape(-1, 1)
+
+    # The support vectors are grouped by class; a pair reads the coefficients
+    # each of its classes holds against the other
+    starts = np.concatenate([[0], np.cumsum(svc.n_support_)])
+    pairs = class_pairs(len(svc.classes_))
+    decision = np.empty((kernel.shape[0], len(pairs)))
+    for pair, (i, j) in enumerate(pairs):
+        first = slice(starts[i], starts[i + 1])
+        second = slice(starts[j], starts[j + 1])
+        decision[:, pair] = (kernel[:, first] @ dual_coef[j - 1, first] + kernel[:, second] @ dual_coef[i, second]
+                             + svc.intercept_[pair])
+    return decision
+
+
+def ovo_votes(decision):
+    """Return the one-vs-one votes of every class for a block of decision values."""
+    n_classes = int(round((1 + np.sqrt(1 + 8 * decision.shape[1])) / 2))
+    votes = np.zeros((len(decision), n_classes), dtype=np.int64)
+    for pair, (i, j) in enumerate(class_pairs(n_classes)):
+        first = decision[:, pair] > 0
+        votes[:, i] += first
+        votes[:, j] += ~first
+    return votes
+
+
+def ovr_decision(decision):
+    """Return the one-vs-rest decision values SVC derives from one-vs-one values: votes plus scaled confidences."""
+    votes = ovo_votes(decision)
+    confidences = np.zeros(votes.shape)
+    for pair, (i, j) in enumerate(class_pairs(votes.shape[1])):
+        confidences[:, i] += decision[:, pair]
+        confidences[:, j] -= decision[:, pair]
+    return votes + confidences / (3 * (np.abs(confidences) + 1))
+
+
+class CachedKernelSVC(ClassifierMixin, BaseEstimator):
+    """RBF SVC that trains and predicts on kernel matrices taken from a KernelCache.
+
+    Fitting several models with the same gamma on the same rows, such as a sweep
+    over C, computes the Gram matrix only once.  Predictions evaluate the kernel
+    against the support vectors only, outside the cache, and vote one-vs-one.
+    """
+
+    def __init__(self, C=1.0, gamma='scale', class_weight=None, tol=1e-3, max_iter=-1,
+                 decision_function_shape='ovr', cache=None):
+        self.C = C
+        self.gamma = gamma
+        self.class_weight = class_weight
+        self.tol = tol
+        self.max_iter = max_iter
+        self.decision_function_shape = decision_function_shape
+        self.cache = cache
+
+    def _cache(self):
+        return default_cache if self.cache is None else self.cache
+
+    def fit(self, X, y):
+        X = np.asarray(X)
+        self.gamma_ = resolve_gamma(self.gamma, X)
+        self.svc_ = SVC(kernel='precomputed', C=self.C, class_weight=self.class_weight, tol=self.tol,
+                        max_iter=self.max_iter, decision_function_shape=self.decision_function_shape)
+        self.svc_.fit(self._cache().rbf(X, gamma=self.gamma_), y)
+
+        self.support_vectors_ = X[self.svc_.support_]
+        self.classes_ = self.svc_.classes_
+        return self
+
+    def _ovo_decision(self, X):
+        return ovo_decision(rbf_kernel(np.asarray(X), self.support_vectors_, gamma=self.gamma_), self.svc_)
+
+    def decision_function(self, X):
+        decision = self._ovo_decision(X)
+        if len(self.classes_) == 2:
+            return -decision.ravel()
+        if self.decision_function_shape == 'ovr':
+            return ovr_decision(decision)
+        return decision
+
+    def predict(self, X):
+        # Ties go to the first class, as in libsvm
+        return self.classes_[ovo_votes(self._ovo_decision(X)).argmax(axis=1)]
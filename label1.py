@@ -5,8 +5,7 @@
 #import libraries
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
+import plots
 from sklearn.decomposition import PCA
 from sklearn.preprocessing import RobustScaler
 from sklearn.model_selection import train_test_split
@@ -16,9 +15,13 @@ from sklearn.ensemble import RandomForestClassifier
 from sklearn.linear_model import LogisticRegression
 from sklearn.svm import SVC
 from sklearn.metrics import classification_report
-from xgboost import XGBClassifier
-from catboost import CatBoostClassifier
 from sklearn.metrics import accuracy_score, precision_score, recall_score
+from shared_preprocessing import load_shared_preprocessing
+from feature_selection import SelectionPlan
+from imputation import labelled_rows
+from kernel_cache import CachedKernelSVC
+from batch_prediction import predict_chunked
+from ann_knn import ANNKNeighborsClassifier
 
 # %% [markdown]
 # Import training, validation and testing datasets
@@ -29,12 +32,11 @@ train_path = '/kaggle/input/audiomintest-layer7-dataset/train.csv'
 valid_path = '/kaggle/input/audiomintest-layer7-dataset/valid.csv'
 test_path = '/kaggle/input/audiomintest-layer7-dataset/test.csv'
 
-# Load the train dataset
-train_data = pd.read_csv(train_path)
-# Load the valid dataset
-valid_data = pd.read_csv(valid_path)
-# Load the test dataset
-test_data = pd.read_csv(test_path)
+# Load the imputed datasets and their correlation analysis from the shared preprocessing cache
+shared = load_shared_preprocessing(train_path, valid_path, test_path)
+train_data = shared['train_data']
+valid_data = shared['valid_data']
+test_data = shared['test_data']
 
 # %% [markdown]
 # Visualize original training data
@@ -47,23 +49,13 @@ train_data.head()
 
 # %%
 # Assess the presence of null values in the training dataset
-train_null_counts = train_data.isnull().sum()
+train_null_counts = shared['train_null_counts']
 print("Null value counts in the training dataset: \n{}".format(train_null_counts))
 
 
 
 # %% [markdown]
-# Impute null values in the features of the train, valid, and test datasets by replacing them with their respective means.
-
-# %%
-# Replace null values with the mean in the training dataset
-train_data = train_data.fillna(train_data.mean())
-
-# Replace null values with the mean in the validation dataset
-valid_data = valid_data.fillna(valid_data.mean())
-
-# Replace null values with the mean in the test dataset
-test_data = test_data.fillna(test_data.mean())
+# The null values in the features were already filled with the training means in the train, valid and test datasets by the shared preprocessing stage.
 
 
 # %% [markdown]
@@ -84,6 +76,12 @@ train_label1 = train_data.iloc[:, -4]
 valid_features = valid_data.iloc[:, :-4]
 valid_label1 = valid_data.iloc[:, -4]
 
+# Keep the rows where label 1 is observed; their features are gathered later together with the selected columns
+train_rows = labelled_rows(train_label1)
+valid_rows = labelled_rows(valid_label1)
+train_label1 = train_label1.iloc[train_rows]
+valid_label1 = valid_label1.iloc[valid_rows]
+
 # Split the test dataset into features and labels
 # test_features = test_data.iloc[:, :-4]
 columns_to_remove = ['ID']
@@ -121,32 +119,19 @@ print(valid_features.shape)
 
 # %%
 # Visualize the distribution of the first target label in the training dataset
-unique_labels, label_counts = np.unique(train_label1, return_counts=True)
-
-plt.figure(figsize=(22, 6))
-plt.xticks(unique_labels)
-plt.bar(unique_labels, label_counts, color='lightcoral')
-plt.xlabel('Label 1')
-plt.ylabel('Count')
-plt.title('Distribution of Label 1 in Training Data')
-plt.show()
+plots.label_distribution(train_label1, 'Label 1', 'Count', 'Distribution of Label 1 in Training Data', figsize=(22, 6),
+                         name='label_1_distribution')
 
 
 # %% [markdown]
 # Calculate the correlation matrix of the training data features
 
 # %%
-# Compute the correlation matrix among the features
-correlation_matrix = train_features.corr()
-
-# Create a mask for the upper triangle of the correlation matrix
-mask = np.triu(np.ones_like(correlation_matrix))
+# Reuse the correlation matrix among the features computed by the shared preprocessing stage
+correlation_matrix = shared['correlation_matrix']
 
-# Generate a heatmap to visualize the correlation matrix using seaborn
-plt.figure(figsize=(12, 12))
-sns.heatmap(correlation_matrix, cmap='gray', center=0, mask=mask)
-plt.title("Correlation Matrix")
-plt.show()
+# Heatmap of the correlation matrix, skipped in headless mode
+plots.correlation_heatmap(correlation_matrix, name='label_1_correlation_matrix')
 
 
 # %% [markdown]
@@ -156,15 +141,8 @@ plt.show()
 # Define a correlation threshold
 correlation_threshold = 0.9
 
-# Initialize a set to store highly correlated feature pairs
-highly_correlated_features = set()
-
-# Identify highly correlated features
-for i in range(len(correlation_matrix.columns)):
-    for j in range(i):
-        if abs(correlation_matrix.iloc[i, j]) > correlation_threshold:
-            feature_name = correlation_matrix.columns[i]
-            highly_correlated_features.add(feature_name)
+# Look up the highly correlated features identified by the shared preprocessing stage
+highly_correlated_features = shared['correlated_features'][correlation_threshold]
 
 
 
@@ -172,10 +150,9 @@ for i in range(len(correlation_matrix.columns)):
 # Remove the previously identified highly correlated features from all the datasets
 
 # %%
-# Eliminate features that are highly correlated
-train_features = train_features.drop(columns=highly_correlated_features)
-valid_features = valid_features.drop(columns=highly_correlated_features)
-test_features = test_features.drop(columns=highly_correlated_features)
+# Record the elimination of the highly correlated features; the columns are gathered once the selection is complete
+selection_plan = SelectionPlan(train_features.columns)
+selection_plan.drop(highly_correlated_features, 'correlated with another feature')
 
 
 # %% [markdown]
@@ -183,13 +160,13 @@ test_features = test_features.drop(columns=highly_correlated_features)
 
 # %%
 # Show the number of features after filtering in the training dataset
-print("Number of features after filtering in training data: {}".format(train_features.shape))
+print("Number of features after filtering in training data: {}".format((len(train_data), selection_plan.n_features)))
 
 # Show the number of features after filtering in the validation dataset
-print("Number of features after filtering in validation data: {}".format(valid_features.shape))
+print("Number of features after filtering in validation data: {}".format((len(valid_data), selection_plan.n_features)))
 
 # Show the number of features after filtering in the test dataset
-print("Number of features after filtering in test data: {}".format(test_features.shape))
+print("Number of features after filtering in test data: {}".format((len(test_data), selection_plan.n_features)))
 
 
 # %% [markdown]
@@ -197,7 +174,7 @@ print("Number of features after filtering in test data: {}".format(test_features
 
 # %%
 # Compute the correlation between features and the first target label
-correlation_with_target = train_features.corrwith(train_label1)
+correlation_with_target = selection_plan.target_correlation(train_data, train_label1, train_rows)
 
 # Define a correlation threshold
 correlation_threshold = 0.01
@@ -212,14 +189,13 @@ print(highly_correlated_features)
 # Extract the features that are only highly correlated with the label from all datasets
 
 # %%
-# Remove features with low correlation from the training dataset
-train_features = train_features[highly_correlated_features.index]
-
-# Remove features with low correlation from the validation dataset
-valid_features = valid_features[highly_correlated_features.index]
+# Keep only the features correlated with the label
+selection_plan.keep(highly_correlated_features.index, 'correlated with the label')
 
-# Remove features with low correlation from the test dataset
-test_features = test_features[highly_correlated_features.index]
+# Gather the selected columns of the training, validation and test datasets in one step each
+train_features = selection_plan.apply(train_data, train_rows)
+valid_features = selection_plan.apply(valid_data, valid_rows)
+test_features = selection_plan.apply(test_data)
 
 
 # %% [markdown]
@@ -258,12 +234,8 @@ explained_variance_ratio_reduced = pca.explained_variance_ratio_
 print("Explained Variance Ratio after Dimensionality Reduction:", explained_variance_ratio_reduced)
 
 # Plot the explained variance ratio
-plt.figure(figsize=(18, 10))
-plt.bar(range(1, pca_train_result.shape[1] + 1), explained_variance_ratio_reduced, color='lightcoral')
-plt.xlabel('Principal Component')
-plt.ylabel('Explained Variance Ratio')
-plt.title('Explained Variance Ratio per Principal Component')
-plt.show()
+plots.explained_variance(explained_variance_ratio_reduced, 'Explained Variance Ratio per Principal Component',
+                        name='label_1_explained_variance')
 
 # Display the reduced feature matrix shapes
 print("Shape of Reduced Train Feature Matrix: {}".format(pca_train_result.shape))
@@ -298,7 +270,8 @@ calc_accuracy_score(LogisticRegression(),pca_train_result,train_label1,pca_valid
 # KNeighborsClassifer
 
 # %%
-calc_accuracy_score(KNeighborsClassifier(),pca_train_result,train_label1,pca_valid_result,valid_label1)
+# Approximate nearest-neighbour search over an IVF index of pca_train_result, same votes as KNeighborsClassifier()
+calc_accuracy_score(ANNKNeighborsClassifier(),pca_train_result,train_label1,pca_valid_result,valid_label1)
 
 
 # %% [markdown]
@@ -312,15 +285,32 @@ calc_accuracy_score(RandomForestClassifier(),pca_train_result,train_label1,pca_v
 # XGBClassifier
 
 # %%
-calc_accuracy_score( XGBClassifier(num_class=len(train_label1.unique())),pca_train_result,train_label1-1,pca_valid_result,valid_label1)
+# Import the boosting libraries only for the cells that use them
+from xgboost import XGBClassifier
+
+# XGBoost expects the classes as 0..n_classes-1, so shift the validation labels the same way
+calc_accuracy_score( XGBClassifier(num_class=len(train_label1.unique()), tree_method='hist', n_jobs=-1),pca_train_result,train_label1-1,pca_valid_result,valid_label1-1)
 
 
 # %% [markdown]
 # CatBoostClassifer
 
 # %%
-calc_accuracy_score(  CatBoostClassifier(loss_function='MultiClass', task_type="GPU",
-                           devices='0:1'), tree_method='gpu_hist', gpu_id= 0),pca_train_result,train_label1,pca_valid_result,valid_label1)
+from catboost import CatBoostClassifier
+
+calc_accuracy_score(  CatBoostClassifier(loss_function='MultiClass', task_type="CPU",
+                           thread_count=-1, verbose=False),pca_train_result,train_label1,pca_valid_result,valid_label1)
+
+
+# %% [markdown]
+# Gradient boosting on CPU: histogram-binned features reused across boosting rounds, early stopping on the validation data
+
+# %%
+from gradient_boosting import BoostedLabelModel
+
+boosted_model = BoostedLabelModel(n_jobs=-1).fit(pca_train_result, train_label1, pca_valid_result, valid_label1)
+print("Boosting rounds kept: {}".format(boosted_model.best_iteration_ + 1))
+accuracy_score(valid_label1, boosted_model.predict(pca_valid_result))
 
 
 # %% [markdown]
@@ -329,14 +319,15 @@ calc_accuracy_score(  CatBoostClassifier(loss_function='MultiClass', task_type="
 # %%
 # Hyper Parameter Tuning For SVC
 
-from sklearn.model_selection import GridSearchCV
+from hyperparameter_search import SuccessiveHalvingSearch
   
 # defining parameter range
 param_grid = {'C': [0.1, 1, 10, 100, 1000], 
               'gamma': [1, 0.1, 0.01, 0.001, 0.0001],
               'kernel': ['rbf']} 
   
-grid = GridSearchCV(SVC(), param_grid, refit = True, verbose = 3)
+# successive halving on all cores, reusing each fold's kernel for every C value
+grid = SuccessiveHalvingSearch(SVC(), param_grid, refit = True, verbose = 3)
   
 # fitting the model for grid search
 grid.fit(pca_train_result, train_label1)
@@ -350,10 +341,12 @@ grid.best_params_
 # 
 
 # %%
-best_model_label_1 = SVC(C=100, gamma='0.001', kernel='rbf')
+best_model_label_1 = CachedKernelSVC(C=100, gamma=0.001)
 best_model_label_1.fit(pca_train_result,train_label1)
-pred_label1 = best_model_label_1.predict(pca_valid_result)
-accuracy_score(valid_label1, pred_label1 )
+# Predict in chunks so the kernel against the support vectors stays small
+pred_label1 = predict_chunked(best_model_label_1, pca_test_result)
+pred = predict_chunked(best_model_label_1, pca_valid_result)
+accuracy_score(valid_label1, pred )
 
 # %% [markdown]
 # Select the model that best predicts the valid and test datasets based on accuracy, precision and recall
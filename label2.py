@@ -5,16 +5,19 @@
 #import libraries
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
+import plots
 from sklearn.svm import SVC
 from sklearn.neighbors import KNeighborsClassifier
 from sklearn.preprocessing import RobustScaler
 from sklearn.decomposition import PCA
 from sklearn.model_selection import train_test_split
 from sklearn.model_selection import cross_val_score
-from xgboost import XGBRegressor
 from sklearn.metrics import accuracy_score,mean_squared_error, r2_score
+from shared_preprocessing import load_shared_preprocessing
+from feature_selection import SelectionPlan
+from imputation import labelled_rows
+from ann_knn import ANNKNeighborsClassifier
+from batch_prediction import predict_chunked
 
 # %% [markdown]
 # Import training, validation and testing datasets
@@ -24,12 +27,11 @@ from sklearn.metrics import accuracy_score,mean_squared_error, r2_score
 train_path = '/kaggle/input/audiomintest-layer7-dataset/train.csv'
 valid_path = '/kaggle/input/audiomintest-layer7-dataset/valid.csv'
 test_path = '/kaggle/input/audiomintest-layer7-dataset/test.csv'
-# Load the training dataset
-train_data = pd.read_csv(train_path)
-# Load the validation dataset
-valid_data = pd.read_csv(valid_path)
-# Load the testing dataset
-test_data = pd.read_csv(test_path)
+# Load the imputed datasets and their correlation analysis from the shared preprocessing cache
+shared = load_shared_preprocessing(train_path, valid_path, test_path)
+train_data = shared['train_data']
+valid_data = shared['valid_data']
+test_data = shared['test_data']
 
 
 # %% [markdown]
@@ -46,24 +48,13 @@ train_data.head()
 
 # %%
 # Check for null values in train dataset
-train_null_counts = train_data.isnull().sum()
+train_null_counts = shared['train_null_counts']
 print("train null counts : \n {}".format(train_null_counts))
 
-# Drop rows with null values in the final four columns (target labels) for train dataset
-train_data = train_data.dropna(subset=train_data.columns[-4:], how='any')
+# Rows with a null label 2 are kept here and left out when the features of the label 2 rows are gathered
 
 # %% [markdown]
-# Fill the null values in the features with their means in the train, valid and test datasets.
-
-# %%
-# Fill null values with mean in train dataset
-train_data = train_data.fillna(train_data.mean())
-
-# Fill null values with mean in valid dataset
-valid_data = valid_data.fillna(valid_data.mean())
-
-# Fill null values with mean in test dataset
-test_data = test_data.fillna(test_data.mean())
+# The null values in the features were already filled with the training means in the train, valid and test datasets by the shared preprocessing stage.
 
 # %% [markdown]
 # Visualize processed training data
@@ -102,6 +93,12 @@ valid_label2 = valid_labels.iloc[:,1]
 # # get the second label of the test dataset
 # test_label2 = test_labels.iloc[:,1]
 
+# Keep the rows where label 2 is observed; their features are gathered later together with the selected columns
+train_rows = labelled_rows(train_label2)
+valid_rows = labelled_rows(valid_label2)
+train_label2 = train_label2.iloc[train_rows]
+valid_label2 = valid_label2.iloc[valid_rows]
+
 # %% [markdown]
 # # Making predictions for Label 2 performing feature engineering.
 
@@ -122,30 +119,18 @@ valid_label2 = valid_labels.iloc[:,1]
 
 # %%
 # Plotting the distribution of train_label2
-labels, counts = np.unique(train_label2, return_counts=True)
-
-plt.figure(figsize=(10, 6))
-plt.xticks(labels)
-plt.bar(labels, counts,  color='lightcoral')
-plt.xlabel('Target Label 2')
-plt.ylabel('Frequency')
-plt.title('Distribution of Target Label 2')
-plt.show()
+plots.label_distribution(train_label2, 'Target Label 2', 'Frequency', 'Distribution of Target Label 2', figsize=(10, 6),
+                         name='label_2_distribution')
 
 # %% [markdown]
 # Calculate the correlation matrix of the training data features
 
 # %%
-#Calculate the correlation matrix
-correlation_matrix = train_features.corr()
+# Reuse the correlation matrix computed by the shared preprocessing stage
+correlation_matrix = shared['correlation_matrix']
 
-mask = np.triu(np.ones_like(correlation_matrix))
-
-# Create a heatmap of the correlation matrix using seaborn
-plt.figure(figsize=(12, 12))
-sns.heatmap(correlation_matrix, cmap='gray', center=0, mask=mask)
-plt.title("Correlation Matrix")
-plt.show()
+# Heatmap of the correlation matrix, skipped in headless mode
+plots.correlation_heatmap(correlation_matrix, name='label_2_correlation_matrix')
 
 # %% [markdown]
 # Identify the features that are highly correlated with each other using the traning dataset
@@ -154,14 +139,8 @@ plt.show()
 # Set the threshold for correlation
 correlation_threshold = 0.9
 
-highly_correlated = set()
-
-# Find highly correlated features
-for i in range(len(correlation_matrix.columns)):
-    for j in range(i):
-        if abs(correlation_matrix.iloc[i, j]) > correlation_threshold:
-            colname = correlation_matrix.columns[i]
-            highly_correlated.add(colname)
+# Look up the highly correlated features found by the shared preprocessing stage
+highly_correlated = shared['correlated_features'][correlation_threshold]
 
 print(highly_correlated)
 
@@ -169,10 +148,12 @@ print(highly_correlated)
 # Remove the previously identified highly correlated features from all the datasets
 
 # %%
-# Remove highly correlated features
-train_features = train_features.drop(columns=highly_correlated)
-valid_features = valid_features.drop(columns=highly_correlated)
-test_features = test_features.drop(columns=highly_correlated)
+# Record the removal of the highly correlated features and gather the remaining columns of every dataset once
+selection_plan = SelectionPlan(train_features.columns)
+selection_plan.drop(highly_correlated, 'correlated with another feature')
+train_features = selection_plan.apply(train_data, train_rows)
+valid_features = selection_plan.apply(valid_data, valid_rows)
+test_features = selection_plan.apply(test_data)
 
 # %% [markdown]
 # Display the resulting feature shapes of the datasets
@@ -192,7 +173,7 @@ print("Filtered test features: {}".format(test_features.shape))
 
 # %%
 # Calculate the correlation matrix between features and train_label2
-correlation_with_target = train_features.corrwith(train_label2)
+correlation_with_target = selection_plan.target_correlation(train_data, train_label2, train_rows)
 
 # Set the correlation threshold
 correlation_threshold = 0.05
@@ -206,14 +187,17 @@ print(highly_correlated_features)
 # Extract the features that are only highly correlated with the label from all datasets
 
 # %%
+# # Keep only the features correlated with the label
+# selection_plan.keep(highly_correlated_features.index, 'correlated with the label')
+
 # # Drop the features with low correlated in train data
-# train_features = train_features[highly_correlated_features.index]
+# train_features = selection_plan.apply(train_data, train_rows)
 
 # # Drop the features with low correlated in valid data
-# valid_features = valid_features[highly_correlated_features.index]
+# valid_features = selection_plan.apply(valid_data, valid_rows)
 
 # # Drop the features with low correlated in test data
-# test_features = test_features[highly_correlated_features.index]
+# test_features = selection_plan.apply(test_data)
 
 # %% [markdown]
 # Display the resulting feature shapes of the datasets
@@ -263,12 +247,8 @@ explained_variance_ratio_reduced = pca.explained_variance_ratio_
 print("Explained Variance Ratio after Dimensionality Reduction:", explained_variance_ratio_reduced)
 
 # Plot explained variance ratio
-plt.figure(figsize=(18, 10))
-plt.bar(range(1, pca_train_result.shape[1] + 1), explained_variance_ratio_reduced, color='lightcoral')
-plt.xlabel('Principal Component')
-plt.ylabel('Explained Variance Ratio')
-plt.title('Explained Variance Ratio per Principal Component (Reduced)')
-plt.show()
+plots.explained_variance(explained_variance_ratio_reduced, 'Explained Variance Ratio per Principal Component (Reduced)',
+                        name='label_2_explained_variance')
 
 # Display the reduced train feature matrix
 print("Reduced Train feature matrix shape: {}".format(pca_train_result.shape))
@@ -293,38 +273,39 @@ def calc_accuracy_score(model, X_train, y_train, X_val, y_val, verbose = False):
 # Kneighborsclassifier
 
 # %%
-calc_accuracy_score(KNeighborsClassifier(),pca_train_result,train_label1,pca_valid_result,valid_label1)
+# Approximate nearest-neighbour search over an IVF index of pca_train_result, same votes as KNeighborsClassifier()
+calc_accuracy_score(ANNKNeighborsClassifier(),pca_train_result,train_label2,pca_valid_result,valid_label2)
 
 # %% [markdown]
 # CatBoostClassfier
 
 # %%
+from catboost import CatBoostClassifier
+
 calc_accuracy_score(CatBoostClassifier(loss_function='MultiClass'
-                       , learning_rate = 0.15),pca_train_result,train_label1,pca_valid_result,valid_label1)
+                       , learning_rate = 0.15),pca_train_result,train_label2,pca_valid_result,valid_label2)
 
 # %%
-from sklearn.model_selection import GridSearchCV
+from ann_knn import cross_val_sweep
 
-leaf_size = list(range(1,50))
 n_neighbors = list(range(1,30))
 p=[1,2]
-hyperparameters = dict(leaf_size=leaf_size, n_neighbors=n_neighbors, p=p)
-#Use GridSearch
-clf = GridSearchCV(KNeighborsClassifier(), hyperparameters, cv=10)
-best_model = clf.fit(X_train_pca,y_train['label_2'])
-print('Best leaf_size:', best_model.best_estimator_.get_params()['leaf_size'])
-print('Best p:', best_model.best_estimator_.get_params()['p'])
-print('Best n_neighbors:', best_model.best_estimator_.get_params()['n_neighbors'])
-
-best_model.best_estimator_
+# leaf_size only changes the speed of the exact trees, so it is not searched; every fold
+# builds one approximate index and one k=29 query per p answers all smaller k
+knn_scores, best_params = cross_val_sweep(pca_train_result, train_label2, n_neighbors, p, cv=10)
+print('Best p:', best_params['p'])
+print('Best n_neighbors:', best_params['n_neighbors'])
+print('Cross-validated accuracy:', knn_scores[best_params['n_neighbors'], best_params['p']])
 
 # %% [markdown]
 # Select the best model. hyperparameter tuning gives SVC(C=1000)
 
 # %%
 best_model_label_2 = SVC(C=1000)
-pred_label2 = best_model_label_2.fit(pca_train_result, train_label2).predict(pca_test_result)
-pred = best_model_label_2.predict(pca_valid_result)
+best_model_label_2.fit(pca_train_result, train_label2)
+# Predict in chunks so the kernel against the support vectors stays small
+pred_label2 = predict_chunked(best_model_label_2, pca_test_result)
+pred = predict_chunked(best_model_label_2, pca_valid_result)
 accuracy_score(valid_label2, pred )
 
 
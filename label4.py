@@ -5,8 +5,7 @@
 #import libraries
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
+import plots
 
 from sklearn.preprocessing import StandardScaler
 from sklearn.model_selection import cross_val_score
@@ -16,11 +15,16 @@ from sklearn.model_selection import train_test_split
 from sklearn.neighbors import KNeighborsClassifier
 from sklearn.tree import DecisionTreeClassifier
 from sklearn.ensemble import RandomForestClassifier
-from xgboost import XGBClassifier
 from sklearn.svm import SVC
 
 from sklearn.metrics import accuracy_score, precision_score, recall_score
 
+from shared_preprocessing import load_shared_preprocessing
+from feature_selection import SelectionPlan
+from imputation import labelled_rows
+from kernel_cache import CachedKernelSVC, KernelCache
+from batch_prediction import predict_chunked
+
 # %% [markdown]
 # Import training, validation and testing datasets
 
@@ -30,12 +34,11 @@ train_path = '/kaggle/input/audiomintest-layer7-dataset/train.csv'
 valid_path = '/kaggle/input/audiomintest-layer7-dataset/valid.csv'
 test_path = '/kaggle/input/audiomintest-layer7-dataset/test.csv'
 
-# Load the train dataset
-train_data = pd.read_csv(train_path)
-# Load the valid dataset
-valid_data = pd.read_csv(valid_path)
-# Load the test dataset
-test_data = pd.read_csv(test_path)
+# Load the imputed datasets and their correlation analysis from the shared preprocessing cache
+shared = load_shared_preprocessing(train_path, valid_path, test_path)
+train_data = shared['train_data']
+valid_data = shared['valid_data']
+test_data = shared['test_data']
 
 # %% [markdown]
 # Visualize original training data
@@ -51,24 +54,14 @@ train_data.head()
 
 # %%
 # Check for null values in train dataset
-train_null_counts = train_data.isnull().sum()
+train_null_counts = shared['train_null_counts']
 print("train null counts : \n {}".format(train_null_counts))
 
 # Drop rows with null values in the final four columns (target labels) for train dataset
 # train_data = train_data.dropna(subset=train_data.columns[-4:], how='any')
 
 # %% [markdown]
-# Fill the null values in the features with their means in the train, valid and test datasets.
-
-# %%
-# Fill null values with mean in train dataset
-train_data = train_data.fillna(train_data.mean())
-
-# Fill null values with mean in valid dataset
-valid_data = valid_data.fillna(valid_data.mean())
-
-# Fill null values with mean in test dataset
-test_data = test_data.fillna(test_data.mean())
+# The null values in the features were already filled with the training means in the train, valid and test datasets by the shared preprocessing stage.
 
 # %% [markdown]
 # Visualize processed training data
@@ -108,6 +101,12 @@ train_label4 = train_labels.iloc[:,3]
 # get the fourth label of the valid dataset
 valid_label4 = valid_labels.iloc[:,3]
 
+# Keep the rows where label 4 is observed; their features are gathered later together with the selected columns
+train_rows = labelled_rows(train_label4)
+valid_rows = labelled_rows(valid_label4)
+train_label4 = train_label4.iloc[train_rows]
+valid_label4 = valid_label4.iloc[valid_rows]
+
 # # get the fourth label of the test dataset
 # test_label4 = test_labels.iloc[:,3]
 
@@ -131,30 +130,18 @@ valid_label4 = valid_labels.iloc[:,3]
 
 # %%
 # Plotting the distribution of train_label4
-labels, counts = np.unique(train_label4, return_counts=True)
-
-plt.figure(figsize=(22, 6))
-plt.xticks(labels)
-plt.bar(labels, counts,  color='lightcoral')
-plt.xlabel('Target Label 4')
-plt.ylabel('Frequency')
-plt.title('Distribution of Target Label 4')
-plt.show()
+plots.label_distribution(train_label4, 'Target Label 4', 'Frequency', 'Distribution of Target Label 4', figsize=(22, 6),
+                         name='label_4_distribution')
 
 # %% [markdown]
 # Calculate the correlation matrix of the training data features
 
 # %%
-#Calculate the correlation matrix
-correlation_matrix = train_features.corr()
-
-mask = np.triu(np.ones_like(correlation_matrix))
+# Reuse the correlation matrix computed by the shared preprocessing stage
+correlation_matrix = shared['correlation_matrix']
 
-# Create a heatmap of the correlation matrix using seaborn
-plt.figure(figsize=(12, 12))
-sns.heatmap(correlation_matrix, center=0, mask=mask, cmap='gray')
-plt.title("Correlation Matrix")
-plt.show()
+# Heatmap of the correlation matrix, skipped in headless mode
+plots.correlation_heatmap(correlation_matrix, name='label_4_correlation_matrix')
 
 # %% [markdown]
 # Identify the features that are highly correlated with each other using the traning dataset
@@ -163,14 +150,8 @@ plt.show()
 # Set the threshold for correlation
 correlation_threshold = 0.9
 
-highly_correlated = set()
-
-# Find highly correlated features
-for i in range(len(correlation_matrix.columns)):
-    for j in range(i):
-        if abs(correlation_matrix.iloc[i, j]) > correlation_threshold:
-            colname = correlation_matrix.columns[i]
-            highly_correlated.add(colname)
+# Look up the highly correlated features found by the shared preprocessing stage
+highly_correlated = shared['correlated_features'][correlation_threshold]
 
 print(highly_correlated)
 
@@ -178,10 +159,12 @@ print(highly_correlated)
 # Remove the previously identified highly correlated features from all the datasets
 
 # %%
-# Remove highly correlated features
-train_features = train_features.drop(columns=highly_correlated)
-valid_features = valid_features.drop(columns=highly_correlated)
-test_features = test_features.drop(columns=highly_correlated)
+# Record the removal of the highly correlated features and gather the remaining columns of every dataset once
+selection_plan = SelectionPlan(train_features.columns)
+selection_plan.drop(highly_correlated, 'correlated with another feature')
+train_features = selection_plan.apply(train_data, train_rows)
+valid_features = selection_plan.apply(valid_data, valid_rows)
+test_features = selection_plan.apply(test_data)
 
 # %% [markdown]
 # Display the resulting feature shapes of the datasets
@@ -201,7 +184,7 @@ print("Filtered test features: {}".format(test_features.shape))
 
 # %%
 # # Calculate the correlation matrix between features and train_label4
-# correlation_with_target = train_features.corrwith(train_label4)
+# correlation_with_target = selection_plan.target_correlation(train_data, train_label4, train_rows)
 
 # # Set the correlation threshold
 # correlation_threshold = 0.05
@@ -216,13 +199,14 @@ print("Filtered test features: {}".format(test_features.shape))
 
 # %%
 # # Drop the features with low correlated in train data
-# train_features = train_features[highly_correlated_features.index]
+# selection_plan.keep(highly_correlated_features.index, 'correlated with the label')
+# train_features = selection_plan.apply(train_data, train_rows)
 
 # # Drop the features with low correlated in valid data
-# valid_features = valid_features[highly_correlated_features.index]
+# valid_features = selection_plan.apply(valid_data, valid_rows)
 
 # # Drop the features with low correlated in test data
-# test_features = test_features[highly_correlated_features.index]
+# test_features = selection_plan.apply(test_data)
 
 # %% [markdown]
 # Display the resulting feature shapes of the datasets
@@ -272,12 +256,8 @@ explained_variance_ratio_reduced = pca.explained_variance_ratio_
 print("Explained Variance Ratio after Dimensionality Reduction:", explained_variance_ratio_reduced)
 
 # Plot explained variance ratio
-plt.figure(figsize=(18, 10))
-plt.bar(range(1, pca_train_result.shape[1] + 1), explained_variance_ratio_reduced, color='lightcoral')
-plt.xlabel('Principal Component')
-plt.ylabel('Explained Variance Ratio')
-plt.title('Explained Variance Ratio per Principal Component (Reduced)')
-plt.show()
+plots.explained_variance(explained_variance_ratio_reduced, 'Explained Variance Ratio per Principal Component (Reduced)',
+                        name='label_4_explained_variance')
 
 # Display the reduced train feature matrix
 print("Reduced Train feature matrix shape: {}".format(pca_train_result.shape))
@@ -293,15 +273,19 @@ print("Reduced test feature matrix shape: {}".format(pca_test_result.shape))
 # Select the model that best predicts the valid and test datasets based on accuracy, precision and recall
 
 # %%
+# Compute the training Gram matrix once; the folds slice it and the final fit reuses it
+kernel_cache = KernelCache()
+train_kernel = kernel_cache.rbf(pca_train_result, gamma='scale')
 
-
-cross_val_score(SVC(class_weight='balanced', C=1000), pca_train_result, train_label4, cv=5, scoring='accuracy').mean()
+cross_val_score(SVC(class_weight='balanced', C=1000, kernel='precomputed'), train_kernel, train_label4, cv=5, scoring='accuracy').mean()
 
 
 # %%
-best_model_label_4 = SVC(class_weight='balanced', C=1000)
-pred_label4 = best_model_label_4.fit(pca_train_result, train_label4).predict(pca_test_result)
-pred = best_model_label_4.predict(pca_valid_result)
+best_model_label_4 = CachedKernelSVC(class_weight='balanced', C=1000, cache=kernel_cache)
+best_model_label_4.fit(pca_train_result, train_label4)
+# Predict in chunks so the kernel against the support vectors stays small
+pred_label4 = predict_chunked(best_model_label_4, pca_test_result)
+pred = predict_chunked(best_model_label_4, pca_valid_result)
 accuracy_score(valid_label4, pred )
 
 # %% [markdown]
@@ -0,0 +1,177 @@
+# Per-label feature engineering and model pipelines.
+#
+# Each entry of LABEL_CONFIGS reproduces the final pipeline of one label script:
+# drop the inter-correlated features, keep the features correlated with the
+# label, standardize, reduce with PCA and fit the selected SVC.  Setting an
+# ``approximation`` in a config swaps the exact SVC for the approximate-kernel
+# model of approximate_kernel.py with the same C, gamma and class weights.
+# Given a SharedPCABasis, a pipeline takes its scaler and PCA from the shared
+# decomposition instead of fitting its own; otherwise ``pca_backend`` picks the
+# solver of pca_backends.py ('full' by default, as in the scripts).  A ``ranker``
+# of feature_ranking.py with a ``top_k`` replaces the correlation threshold, and
+# a ``reduction`` of subsampling.py fits the model on a class-balanced subset.
+# A ``compression`` of sv_compression.py shrinks the fitted SVC to a support
+# vector budget.
+
+import numpy as np
+from sklearn.preprocessing import RobustScaler, StandardScaler
+from sklearn.svm import SVC
+
+from approximate_kernel import ApproximateKernelClassifier
+from feature_ranking import score_features, top_features
+from feature_selection import SelectionPlan, correlation_with_target
+from pca_backends import fit_pca
+from shared_pca import SharedPCABasis
+from subsampling import reduce_training_set
+from sv_compression import compress_svc
+from telemetry import stage
+
+SCALERS = {
+    'robust': RobustScaler,
+    'standard': StandardScaler,
+}
+
+# Settings of the label1.py - label4.py pipelines.  A ``target_threshold`` of
+# None means the script does not filter features by correlation with the label.
+LABEL_CONFIGS = {
+    1: {
+        'correlation_threshold': 0.9,
+        'target_threshold': 0.01,
+        'scaler': 'robust',
+        'variance_threshold': 0.99,
+        'model_params': {'C': 100, 'gamma': 0.001, 'kernel': 'rbf'},
+    },
+    2: {
+        'correlation_threshold': 0.9,
+        'target_threshold': None,
+        'scaler': 'robust',
+        'variance_threshold': 0.99,
+        'model_params': {'C': 1000},
+    },
+    3: {
+        'correlation_threshold': 0.95,
+        'target_threshold': 0.001,
+        'scaler': 'standard',
+        'variance_threshold': 0.95,
+        'model_params': {'C': 10, 'gamma': 'scale', 'kernel': 'rbf'},
+    },
+    4: {
+        'correlation_threshold': 0.9,
+        'target_threshold': None,
+        'scaler': 'standard',
+        'variance_threshold': 0.95,
+        'model_params': {'class_weight': 'balanced', 'C': 1000},
+    },
+}
+
+LABELS = sorted(LABEL_CONFIGS)
+
+
+def make_model(config):
+    """Return the unfitted model of a label config."""
+    model_params = config['model_params']
+    approximation = config.get('approximation')
+    if approximation is None:
+        return SVC(**model_params)
+    return ApproximateKernelClassifier(C=model_params.get('C', 1.0), gamma=model_params.get('gamma', 'scale'),
+                                       class_weight=model_params.get('class_weight'), **approximation)
+
+
+def fit_shared_basis(features, labels=None):
+    """Fit a SharedPCABasis with every scaler type used by ``labels`` (all labels by default)."""
+    scalers = {LABEL_CONFIGS[label]['scaler'] for label in (labels or LABELS)}
+    return SharedPCABasis({name: SCALERS[name]() for name in sorted(scalers)}).fit(features)
+
+
+class LabelPipeline:
+    """Feature selection, scaling, PCA and SVC of one label, fitted on a NumPy feature block."""
+
+    def __init__(self, label, config=None):
+        self.label = label
+        self.config = dict(LABEL_CONFIGS[label] if config is None else config)
+
+    def fit(self, features, labels, feature_names, correlated_features, shared_basis=None, rows=None):
+        """Fit the pipeline on the training ``features`` block and the label values.
+
+        ``correlated_features`` are the inter-correlated features to drop, as
+        found by the shared preprocessing stage for the configured threshold.
+        With a ``shared_basis`` the scaler and PCA are projected from it.
+        ``rows`` restricts training to the rows where the label is observed
+        (``labels`` then holds their values only); they are gathered together
+        with the selected columns instead of copying the whole block first.
+        """
+        with stage('selection', self.label, len(labels), features.shape[1]) as record:
+            self.feature_indices = self.select_features(features, labels, feature_names, correlated_features, rows)
+            record['selected'] = len(self.feature_indices)
+
+        # Standardize, reduce with PCA and fit the model
+        self.model = make_model(self.config)
+        if shared_basis is None:
+            self.scaler = SCALERS[self.config['scaler']]()
+            with stage('scaling', self.label, len(labels), len(self.feature_indices)):
+                standardized_features = self.scaler.fit_transform(self._gather(features, rows))
+            with stage('pca', self.label, len(labels), len(self.feature_indices)) as record:
+                self.pca = fit_pca(standardized_features, self.config['variance_threshold'],
+                                   self.config.get('pca_backend', 'full'))
+                pca_result = self.pca.transform(standardized_features)
+                record['components'] = self.pca.n_components_
+        else:
+            with stage('pca', self.label, len(labels), len(self.feature_indices)) as record:
+                self.scaler, self.pca = shared_basis.projection(self.config['scaler'], self.feature_indices,
+                                                                self.config['variance_threshold'])
+                pca_result = self.pca.transform(self.scaler.transform(self._gather(features, rows)))
+                record['components'] = self.pca.n_components_
+        reduction = self.config.get('reduction')
+        if reduction is not None:
+            # Fit the model on a class-balanced subset of the PCA rows
+            with stage('reduction', self.label, *pca_result.shape) as record:
+                kept = reduce_training_set(pca_result, labels, **reduction)
+                pca_result, labels = pca_result[kept], np.asarray(labels)[kept]
+                record['kept'] = len(kept)
+        with stage('fit', self.label, *pca_result.shape):
+            self.model.fit(pca_result, labels)
+
+        compression = self.config.get('compression')
+        if compression is not None and isinstance(self.model, SVC):
+            # Prune the support set and refit the decision functions on the kept vectors
+            with stage('compression', self.label, *pca_result.shape) as record:
+                self.model = compress_svc(self.model, pca_result, labels, **compression)
+                record['support_vectors'] = len(self.model.support_vectors_)
+        return self
+
+    def select_features(self, features, labels, feature_names, correlated_features, rows=None):
+        """Return the indices of the columns the pipeline keeps, recording the decisions in ``selection_plan``."""
+        self.feature_names = list(feature_names)
+        plan = SelectionPlan(self.feature_names)
+
+        # Eliminate features that are highly correlated with each other
+        plan.drop(correlated_features, 'correlated with another feature')
+
+        # Keep the best features of a ranker, or those correlated with the label
+        ranker = self.config.get('ranker')
+        target_threshold = self.config['target_threshold']
+        if ranker is not None:
+            scores = score_features(plan.apply(features, rows), labels, ranker, self.config.get('ranker_jobs', -1))
+            top_k = self.config['top_k']
+            plan.keep(np.asarray(plan.columns)[top_features(scores, top_k)], 'top {} by {}'.format(top_k, ranker))
+        elif target_threshold is not None:
+            correlation = correlation_with_target(plan.apply(features, rows), labels)
+            plan.keep(np.asarray(plan.columns)[np.abs(correlation) > target_threshold], 'correlated with the label')
+
+        self.selection_plan = plan
+        return plan.indices
+
+    def _gather(self, features, rows=None):
+        # One gather of the selected columns, and of ``rows`` when given
+        if rows is None:
+            return features[:, self.feature_indices]
+        return features[np.ix_(rows, self.feature_indices)]
+
+    def transform(self, features):
+        """Return the PCA representation of a raw feature block."""
+        return self.pca.transform(self.scaler.transform(self._gather(features)))
+
+    def predict(self, features):
+        """Predict the label for every row of a raw feature block."""
+        with stage('predict', self.label, *features.shape):
+            return self.model.predict(self.transform(features))
@@ -0,0 +1,147 @@
+# Versioned artifacts of the fitted label pipelines.
+#
+# A model set is a directory holding one joblib file per fitted LabelPipeline
+# and a manifest describing them.  Each training run writes a new version
+# directory under the model root, so a scoring process can keep serving one
+# version while the next is being trained.
+#
+#     <model_dir>/<version>/manifest.json
+#     <model_dir>/<version>/label_<N>.joblib
+
+import datetime
+import json
+import os
+import threading
+import warnings
+
+import joblib
+import numpy as np
+import pandas as pd
+import sklearn
+
+from fused_transform import FusedTransform
+from imputation import MeanImputer
+
+MODEL_DIR = os.environ.get('LAYER7_MODEL_DIR', '/kaggle/working/layer7_models')
+
+# Bump whenever the layout of a model set changes
+ARTIFACT_VERSION = 1
+
+MANIFEST_FILE = 'manifest.json'
+PIPELINE_TEMPLATE = 'label_{}.joblib'
+
+
+def new_version():
+    """Return a version name that sorts after every earlier one."""
+    return datetime.datetime.now(datetime.timezone.utc).strftime('%Y%m%dT%H%M%S%fZ')
+
+
+def save_pipeline(pipeline, version_dir):
+    """Write one fitted LabelPipeline into a version directory."""
+    os.makedirs(version_dir, exist_ok=True)
+    joblib.dump(pipeline, os.path.join(version_dir, PIPELINE_TEMPLATE.format(pipeline.label)))
+
+
+def write_manifest(version_dir, labels, feature_names, feature_means):
+    """Describe the pipelines of a version directory; a version without a manifest is never loaded."""
+    manifest = {
+        'artifact_version': ARTIFACT_VERSION,
+        'version': os.path.basename(os.path.normpath(version_dir)),
+        'created': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'sklearn_version': sklearn.__version__,
+        'labels': sorted(labels),
+        'feature_names': list(feature_names),
+        'feature_means': [float(mean) for mean in feature_means],
+    }
+    with open(os.path.join(version_dir, MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def latest_version(model_dir=MODEL_DIR):
+    """Return the newest complete version in ``model_dir``."""
+    versions = sorted(name for name in os.listdir(model_dir)
+                      if os.path.isfile(os.path.join(model_dir, name, MANIFEST_FILE)))
+    if not versions:
+        raise FileNotFoundError("No model versions found in {}".format(model_dir))
+    return versions[-1]
+
+
+class ModelSet:
+    """The fitted pipelines of every label, loaded once and applied to batches of raw rows.
+
+    Each pipeline's scaler and PCA are folded into a FusedTransform, so a batch
+    reaches every model through one float32 GEMM per label, written into output
+    buffers that are reused while the batch size stays the same.  Every thread
+    has its own buffers, so threads may predict batches concurrently.
+    """
+
+    def __init__(self, manifest, pipelines):
+        self.manifest = manifest
+        self.pipelines = pipelines
+        self.feature_names = manifest['feature_names']
+        self.imputer = MeanImputer.from_means(self.feature_names, manifest['feature_means'])
+        self.transforms = {label: FusedTransform.from_pipeline(pipeline) for label, pipeline in pipelines.items()}
+        self._local = threading.local()
+
+    def __getstate__(self):
+        # The buffers stay with their threads; a pickled copy starts without any
+        state = dict(self.__dict__)
+        del state['_local']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+    @property
+    def version(self):
+        return self.manifest['version']
+
+    @property
+    def labels(self):
+        return self.manifest['labels']
+
+    def features(self, batch):
+        """Return the feature block of a batch, imputing null values with the training means."""
+        if isinstance(batch, pd.DataFrame):
+            batch = batch[self.feature_names].to_numpy(dtype=np.float32)
+        else:
+            batch = np.array(batch, dtype=np.float32)
+        return self.imputer.transform(batch)
+
+    def predict(self, batch):
+        """Predict every label for a DataFrame or array of raw feature rows."""
+        features = self.features(batch)
+        predictions = {}
+        for label in self.labels:
+            pca_result = self.transforms[label].transform(features, out=self._buffer(label, len(features)))
+            predictions['Label {}'.format(label)] = self.pipelines[label].model.predict(pca_result)
+        return pd.DataFrame(predictions)
+
+    def _buffer(self, label, n_rows):
+        buffers = self._local.__dict__.setdefault('buffers', {})
+        buffer = buffers.get(label)
+        if buffer is None or buffer.shape[0] != n_rows:
+            buffer = np.empty((n_rows, self.transforms[label].n_components), dtype=np.float32)
+            buffers[label] = buffer
+        return buffer
+
+
+def load_model_set(model_dir=MODEL_DIR, version=None):
+    """Load a version of the model set, the newest one by default."""
+    version = version or latest_version(model_dir)
+    version_dir = os.path.join(model_dir, version)
+    with open(os.path.join(version_dir, MANIFEST_FILE)) as f:
+        manifest = json.load(f)
+
+    if manifest['artifact_version'] != ARTIFACT_VERSION:
+        raise ValueError("Unsupported model artifact version {} in {}".format(
+            manifest['artifact_version'], version_dir))
+    if manifest['sklearn_version'] != sklearn.__version__:
+        warnings.warn("Model set {} was trained with scikit-learn {} but {} is installed".format(
+            version, manifest['sklearn_version'], sklearn.__version__))
+
+    pipelines = {label: joblib.load(os.path.join(version_dir, PIPELINE_TEMPLATE.format(label)))
+                 for label in manifest['labels']}
+    return ModelSet(manifest, pipelines)
@@ -0,0 +1,156 @@
+# Joint mode: predict labels 1-4 from one fitted representation.
+#
+# The per-label pipelines fit four scalers, four PCAs and four SVCs with their
+# own kernels, and inference runs four chains.  JointLabelModel drops the
+# inter-correlated features, standardizes and reduces the features once, then
+# computes a single RBF Gram matrix of the shared representation.  Each label is
+# a head: an SVC trained on the block of that matrix for the rows where its label
+# is observed, with the C and class weights of the label config.  At inference
+# the kernel is evaluated once, against the union of the support vectors of all
+# heads, and every head reads its own columns of it.
+#
+# Usage (prints accuracy and throughput of the joint model against the per-label pipelines):
+#     python multi_output.py
+
+import numpy as np
+import pandas as pd
+from sklearn.metrics import accuracy_score
+from sklearn.metrics.pairwise import rbf_kernel
+from sklearn.svm import SVC
+
+from feature_selection import SelectionPlan
+from imputation import labelled_rows
+from kernel_cache import KernelCache, ovo_decision, ovo_votes, resolve_gamma
+from label_pipelines import LABEL_CONFIGS, LABELS, SCALERS
+from pca_backends import fit_pca
+
+# Settings of the shared representation: the highest correlation threshold and
+# the highest variance threshold of the label configs, so no label loses the
+# features or components its own pipeline keeps
+JOINT_CONFIG = {
+    'correlation_threshold': max(config['correlation_threshold'] for config in LABEL_CONFIGS.values()),
+    'scaler': 'robust',
+    'variance_threshold': 0.99,
+    'pca_backend': 'full',
+    'gamma': 'scale',
+}
+
+
+class JointLabelModel:
+    """Shared scaler, PCA and RBF kernel with one SVC head per label."""
+
+    def __init__(self, labels=LABELS, config=None, cache=None):
+        self.labels = list(labels)
+        self.config = dict(JOINT_CONFIG if config is None else config)
+        self.cache = KernelCache() if cache is None else cache
+
+    def fit(self, features, labels, feature_names, correlated_features):
+        """Fit the shared representation on all ``features`` rows and a head per label on its observed rows.
+
+        ``labels`` holds one column per label of LABELS, with NaN where a label is missing.
+        """
+        self.feature_names = list(feature_names)
+        self.selection_plan = SelectionPlan(self.feature_names).drop(correlated_features,
+                                                                     'correlated with another feature')
+
+        # Standardize and reduce once for every label
+        self.scaler = SCALERS[self.config['scaler']]()
+        standardized_features = self.scaler.fit_transform(self.selection_plan.apply(features))
+        self.pca = fit_pca(standardized_features, self.config['variance_threshold'], self.config['pca_backend'])
+        representation = self.pca.transform(standardized_features)
+
+        # One Gram matrix shared by all heads
+        self.gamma_ = resolve_gamma(self.config['gamma'], representation)
+        gram = self.cache.rbf(representation, gamma=self.gamma_)
+
+        self.heads = {}
+        self.head_rows_ = {}
+        for label in self.labels:
+            rows = labelled_rows(labels[:, label - 1])
+            model_params = LABEL_CONFIGS[label]['model_params']
+            head = SVC(kernel='precomputed', C=model_params.get('C', 1.0),
+                       class_weight=model_params.get('class_weight'))
+            head.fit(gram[np.ix_(rows, rows)], labels[rows, label - 1].astype(np.int64))
+            self.heads[label] = head
+            self.head_rows_[label] = rows
+
+        # Inference evaluates the kernel only against the support vectors of some head
+        support_rows = {label: self.head_rows_[label][head.support_] for label, head in self.heads.items()}
+        self.support_rows_ = np.unique(np.concatenate(list(support_rows.values())))
+        self.support_vectors_ = representation[self.support_rows_]
+        self.head_columns_ = {label: np.searchsorted(self.support_rows_, rows) for label, rows in support_rows.items()}
+        return self
+
+    def transform(self, features):
+        """Return the shared representation of a raw feature block."""
+        return self.pca.transform(self.scaler.transform(self.selection_plan.apply(features)))
+
+    def predict(self, features):
+        """Predict every label for a raw feature block in one pass; returns a DataFrame of 'Label N' columns."""
+        kernel = rbf_kernel(self.transform(features), self.support_vectors_, gamma=self.gamma_)
+
+        predictions = {}
+        for label, head in self.heads.items():
+            # Every head votes one-vs-one on its own support-vector columns of the kernel
+            decision = ovo_decision(kernel[:, self.head_columns_[label]], head)
+            predictions['Label {}'.format(label)] = head.classes_[ovo_votes(decision).argmax(axis=1)]
+        return pd.DataFrame(predictions)
+
+
+JOINT_COLUMNS = [('label', 'label', 5, ''), ('mode', 'mode', 10, ''), ('accuracy', 'accuracy', 9, '.4f')]
+
+
+def compare_with_per_label(shared, labels):
+    """Return per-label accuracy rows and fit/predict timings of the per-label pipelines and the joint model."""
+    from reports import label_splits, timed
+
+    splits = list(label_splits(shared, labels))
+    # Every split holds the same feature and label blocks
+    feature_names, arrays = splits[0].feature_names, splits[0].arrays
+    valid_features = arrays['valid_features']
+    rows = []
+    timings = {}
+
+    # Per-label baseline: one chain per label for training and for inference
+    fit_time = predict_time = 0.0
+    for split in splits:
+        pipeline, seconds = timed(split.fit)
+        fit_time += seconds
+        pred, seconds = timed(pipeline.predict, valid_features)
+        predict_time += seconds
+        rows.append({'label': split.label, 'mode': 'per-label',
+                     'accuracy': accuracy_score(split.valid_label, pred[split.valid_rows])})
+    timings['per-label'] = {'fit_seconds': fit_time, 'predict_seconds': predict_time}
+
+    # Joint model: one representation and one kernel evaluation for every label
+    model, fit_time = timed(JointLabelModel(labels).fit, arrays['train_features'], arrays['train_labels'],
+                            feature_names, shared['correlated_features'][JOINT_CONFIG['correlation_threshold']])
+    predictions, predict_time = timed(model.predict, valid_features)
+    for split in splits:
+        pred = predictions['Label {}'.format(split.label)].to_numpy()[split.valid_rows]
+        rows.append({'label': split.label, 'mode': 'joint', 'accuracy': accuracy_score(split.valid_label, pred)})
+    timings['joint'] = {'fit_seconds': fit_time, 'predict_seconds': predict_time,
+                        'n_components': model.pca.n_components_, 'n_support_vectors': len(model.support_rows_)}
+
+    for timing in timings.values():
+        timing['rows_per_second'] = len(valid_features) / timing['predict_seconds']
+    return rows, timings
+
+
+def main():
+    from reports import load_shared, print_table, report_parser
+
+    args = report_parser('Compare the joint model with the per-label pipelines.').parse_args()
+
+    rows, timings = compare_with_per_label(load_shared(args), args.labels)
+    print_table(rows, JOINT_COLUMNS)
+    for mode, timing in timings.items():
+        print("{}: fit {:.3f}s, predict {:.3f}s ({:.0f} rows/s for all labels)".format(
+            mode, timing['fit_seconds'], timing['predict_seconds'], timing['rows_per_second']))
+    joint = timings['joint']
+    print("joint representation: {} components, {} distinct support vectors".format(
+        joint['n_components'], joint['n_support_vectors']))
+
+
+if __name__ == '__main__':
+    main()
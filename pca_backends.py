@@ -0,0 +1,140 @@
+# PCA backends for the label pipelines.
+#
+# The label scripts use PCA(n_components=<variance>, svd_solver='full'), an
+# O(n * d^2) decomposition that holds the whole matrix in memory.  Two other
+# backends keep the same "keep components until they explain more than the
+# variance threshold" rule:
+#
+#   randomized   randomized SVD with a growing number of components, stopped as
+#                soon as the components found explain enough variance
+#   incremental  IncrementalPCA fed row batches, so the matrix can be a
+#                memory-mapped block larger than RAM
+#
+# Usage (prints the time, peak memory and width of every backend per label;
+# the incremental backend reads the scaled matrix from a memory-mapped file):
+#     python pca_backends.py
+
+import os
+import tempfile
+import tracemalloc
+
+import numpy as np
+from sklearn.decomposition import PCA, IncrementalPCA
+
+BACKENDS = ('full', 'randomized', 'incremental')
+
+
+def n_components_for(explained_variance_ratio, variance_threshold):
+    """Return how many components PCA(n_components=variance_threshold) keeps for these ratios."""
+    cumulative = np.cumsum(explained_variance_ratio)
+    return min(int(np.searchsorted(cumulative, variance_threshold, side='right')) + 1,
+               len(explained_variance_ratio))
+
+
+def _truncate(pca, n_components):
+    # Keep the leading components of a fitted PCA or IncrementalPCA
+    for attribute in ('components_', 'explained_variance_', 'explained_variance_ratio_', 'singular_values_'):
+        setattr(pca, attribute, getattr(pca, attribute)[:n_components])
+    pca.n_components_ = n_components
+    pca.n_components = n_components
+    return pca
+
+
+def fit_randomized_pca(X, variance_threshold, initial_components=32, random_state=0):
+    """Fit a randomized PCA that keeps components until ``variance_threshold`` of the variance is explained."""
+    max_components = min(X.shape)
+    n_components = min(initial_components, max_components)
+    while True:
+        pca = PCA(n_components=n_components, svd_solver='randomized', random_state=random_state).fit(X)
+        # explained_variance_ratio_ is relative to the total variance of X, not of the kept components
+        if pca.explained_variance_ratio_.sum() > variance_threshold or n_components == max_components:
+            return _truncate(pca, n_components_for(pca.explained_variance_ratio_, variance_threshold))
+        if 2 * n_components >= max_components:
+            # Nearly every component is needed, where the full solver is cheaper
+            pca = PCA(n_components=variance_threshold, svd_solver='full').fit(X)
+            return pca
+        n_components *= 2
+
+
+def fit_incremental_pca(X, variance_threshold, batch_size=None):
+    """Fit an IncrementalPCA on row batches of ``X`` and keep components until ``variance_threshold`` is explained.
+
+    ``X`` is only sliced one batch at a time, so it may be a memory-mapped block.
+    """
+    n_samples, n_features = X.shape
+    batch_size = batch_size or 5 * n_features
+    n_components = min(n_features, batch_size, n_samples)
+
+    # Every batch needs at least n_components rows, so a short last batch joins the previous one
+    bounds = list(range(0, n_samples, batch_size)) + [n_samples]
+    if len(bounds) > 2 and bounds[-1] - bounds[-2] < n_components:
+        del bounds[-2]
+
+    pca = IncrementalPCA(n_components=n_components)
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        pca.partial_fit(np.asarray(X[start:stop], dtype=np.float64))
+    return _truncate(pca, n_components_for(pca.explained_variance_ratio_, variance_threshold))
+
+
+def fit_pca(X, variance_threshold, backend='full', **kwargs):
+    """Fit the PCA ``backend`` keeping components until ``variance_threshold`` of the variance is explained."""
+    if backend == 'full':
+        return PCA(n_components=variance_threshold, svd_solver='full').fit(X)
+    if backend == 'randomized':
+        return fit_randomized_pca(X, variance_threshold, **kwargs)
+    if backend == 'incremental':
+        return fit_incremental_pca(X, variance_threshold, **kwargs)
+    raise ValueError("Unknown PCA backend {!r}, expected one of {}".format(backend, BACKENDS))
+
+
+BACKEND_COLUMNS = [
+    ('label', 'label', 5, ''), ('backend', 'backend', 12, ''), ('n_components', 'n_components', 12, ''),
+    ('variance', 'explained_variance', 9, '.4f'), ('fit (s)', 'fit_seconds', 10, '.3f'),
+    ('peak (MB)', 'peak_mb', 10, '.1f'),
+]
+
+
+def compare_backends(shared, labels, backends=BACKENDS):
+    """Return one row per label and backend with the fit time, peak memory and kept components."""
+    from label_pipelines import LABEL_CONFIGS, SCALERS, LabelPipeline
+    from reports import label_splits, timed
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for split in label_splits(shared, labels):
+            config = LABEL_CONFIGS[split.label]
+            features = split.train_features[split.train_rows]
+
+            # Compute the scaled matrix each backend decomposes, as LabelPipeline.fit does
+            feature_indices = LabelPipeline(split.label).select_features(features, split.train_label,
+                                                                         split.feature_names,
+                                                                         split.correlated_features)
+            standardized = SCALERS[config['scaler']]().fit_transform(features[:, feature_indices])
+            path = os.path.join(tmp_dir, 'label_{}.npy'.format(split.label))
+            np.save(path, standardized)
+
+            for backend in backends:
+                X = np.load(path, mmap_mode='r') if backend == 'incremental' else standardized
+                tracemalloc.start()
+                pca, fit_time = timed(fit_pca, X, config['variance_threshold'], backend)
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                rows.append({'label': split.label, 'backend': backend, 'n_components': pca.n_components_,
+                             'explained_variance': float(pca.explained_variance_ratio_.sum()),
+                             'fit_seconds': fit_time, 'peak_mb': peak / 2 ** 20})
+                del X
+    return rows
+
+
+def main():
+    from reports import load_shared, print_table, report_parser
+
+    parser = report_parser('Compare the PCA backends on every label pipeline.')
+    parser.add_argument('--backends', nargs='+', default=list(BACKENDS), choices=BACKENDS)
+    args = parser.parse_args()
+
+    print_table(compare_backends(load_shared(args), args.labels, args.backends), BACKEND_COLUMNS)
+
+
+if __name__ == '__main__':
+    main()
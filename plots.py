@@ -0,0 +1,87 @@
+# Plots of the label scripts, rendered only when someone will look at them.
+#
+# matplotlib and seaborn take seconds to import and the 12x12 correlation
+# heatmap takes seconds to draw, for every label.  The scripts call these
+# functions instead of pyplot, and the plotting libraries are imported on the
+# first plot that is actually drawn.  Two environment variables pick the mode:
+#
+#   LAYER7_HEADLESS=1      skip every plot (batch runs)
+#   LAYER7_REPORT_DIR=DIR  draw off-screen and save each plot as DIR/<name>.png
+#                          for a later report instead of showing it
+#
+# Without either, plots are shown as in the original notebooks.
+
+import os
+
+import numpy as np
+
+HEADLESS_ENV = 'LAYER7_HEADLESS'
+REPORT_DIR_ENV = 'LAYER7_REPORT_DIR'
+
+
+def headless():
+    """Return whether plots are skipped."""
+    return os.environ.get(HEADLESS_ENV, '').lower() in ('1', 'true', 'yes')
+
+
+def _pyplot():
+    # Import matplotlib only when a plot is drawn, off-screen when it goes to a report
+    import matplotlib
+    if os.environ.get(REPORT_DIR_ENV):
+        matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def _finish(plt, name):
+    report_dir = os.environ.get(REPORT_DIR_ENV)
+    if report_dir:
+        os.makedirs(report_dir, exist_ok=True)
+        plt.savefig(os.path.join(report_dir, '{}.png'.format(name)), bbox_inches='tight')
+        plt.close()
+    else:
+        plt.show()
+
+
+def label_distribution(values, xlabel, ylabel='Count', title=None, figsize=(10, 6), name='label_distribution'):
+    """Bar chart of the count of every distinct value of a label."""
+    if headless():
+        return
+    plt = _pyplot()
+    labels, counts = np.unique(values, return_counts=True)
+    plt.figure(figsize=figsize)
+    plt.xticks(labels)
+    plt.bar(labels, counts, color='lightcoral')
+    plt.xlabel(xlabel)
+    plt.ylabel(ylabel)
+    plt.title(title or 'Distribution of {}'.format(xlabel))
+    _finish(plt, name)
+
+
+def correlation_heatmap(correlation_matrix, figsize=(12, 12), name='correlation_matrix'):
+    """Heatmap of the lower triangle of a correlation matrix."""
+    if headless():
+        return
+    plt = _pyplot()
+    import seaborn as sns
+
+    # Mask the upper triangle of the correlation matrix
+    mask = np.triu(np.ones_like(correlation_matrix))
+    plt.figure(figsize=figsize)
+    sns.heatmap(correlation_matrix, cmap='gray', center=0, mask=mask)
+    plt.title("Correlation Matrix")
+    _finish(plt, name)
+
+
+def explained_variance(explained_variance_ratio, title='Explained Variance Ratio per Principal Component',
+                       figsize=(18, 10), name='explained_variance'):
+    """Bar chart of the explained variance ratio of every principal component."""
+    if headless():
+        return
+    plt = _pyplot()
+    plt.figure(figsize=figsize)
+    plt.bar(range(1, len(explained_variance_ratio) + 1), explained_variance_ratio, color='lightcoral')
+    plt.xlabel('Principal Component')
+    plt.ylabel('Explained Variance Ratio')
+    plt.title(title)
+    _finish(plt, name)
@@ -0,0 +1,74 @@
+# Float32 vs float64 parity report for the label pipelines.
+#
+# In the float32 precision mode the feature columns are parsed as float32 and
+# stay float32 through imputation, the shared feature blocks, scaling and PCA;
+# reductions that need the range are accumulated in float64 (the correlation
+# matrix, correlation with the label, the shared PCA covariance and the feature
+# means).  libsvm converts its input to float64 internally, so the SVC fit
+# itself runs in float64 in both modes.  This report fits every label in both
+# precisions and prints the validation accuracy, the agreement of the two
+# predictions, the size of the feature blocks and the time of each stage.
+#
+# Usage:
+#     python precision.py
+
+import time
+import tracemalloc
+
+import numpy as np
+from sklearn.metrics import accuracy_score
+
+from reports import label_splits, print_table, report_parser, timed
+from shared_preprocessing import PRECISIONS, build_shared_preprocessing
+
+PRECISION_COLUMNS = [
+    ('label', 'label', 5, ''), ('precision', 'precision', 9, ''), ('n_components', 'n_components', 12, ''),
+    ('accuracy', 'accuracy', 9, '.4f'), ('agreement', 'agreement', 10, '.4f'), ('fit (s)', 'fit_seconds', 8, '.3f'),
+    ('predict (s)', 'predict_seconds', 12, '.3f'), ('peak (MB)', 'peak_mb', 10, '.1f'),
+]
+
+
+def compare_precisions(train_path, valid_path, test_path, labels):
+    """Return one row per label and precision, and the load time and feature block size of each precision."""
+    rows = []
+    loads = {}
+    predictions = {}
+    for precision in ('float64', 'float32'):
+        # Build without the cache so the load time covers parsing the files
+        start = time.perf_counter()
+        shared = build_shared_preprocessing(train_path, valid_path, test_path, precision=precision)
+        splits = list(label_splits(shared, labels, PRECISIONS[precision]))
+        arrays = splits[0].arrays
+        loads[precision] = {
+            'load_seconds': time.perf_counter() - start,
+            'feature_mb': sum(array.nbytes for key, array in arrays.items() if key.endswith('_features')) / 2 ** 20,
+        }
+
+        for split in splits:
+            tracemalloc.start()
+            pipeline, fit_time = timed(split.fit)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            pred, predict_time = timed(pipeline.predict, split.valid_features)
+            predictions[split.label, precision] = pred
+
+            rows.append({'label': split.label, 'precision': precision, 'n_components': pipeline.pca.n_components_,
+                         'accuracy': accuracy_score(split.valid_label, pred),
+                         'agreement': np.mean(pred == predictions[split.label, 'float64']),
+                         'fit_seconds': fit_time, 'predict_seconds': predict_time, 'peak_mb': peak / 2 ** 20})
+    return rows, loads
+
+
+def main():
+    args = report_parser('Compare the float32 and float64 label pipelines.').parse_args()
+
+    rows, loads = compare_precisions(args.train, args.valid, args.test, args.labels)
+    for precision, load in loads.items():
+        print("{}: preprocessing {:.3f}s, feature blocks {:.1f} MB".format(
+            precision, load['load_seconds'], load['feature_mb']))
+    print_table(rows, PRECISION_COLUMNS)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+# Shared harness of the comparison reports.
+#
+# Every optional stage of the label pipelines has a report that fits the labels
+# on the shared preprocessing of a dataset in a few configurations and prints a
+# table of widths, timings and validation accuracy.  The reports share their
+# command line (--train/--valid/--test and --labels), LabelSplit, which holds the
+# training and validation rows of one label and fits and scores its pipeline,
+# and print_table.  The modules import this one inside their report functions,
+# as it imports the driver.
+
+import argparse
+import time
+
+import numpy as np
+from sklearn.metrics import accuracy_score
+
+from label_pipelines import LABEL_CONFIGS, LABELS, LabelPipeline
+from run_all_labels import label_arrays, observed_rows
+from shared_preprocessing import TEST_PATH, TRAIN_PATH, VALID_PATH, load_shared_preprocessing
+
+
+def report_parser(description, labels=LABELS):
+    """Return an argument parser with the dataset paths and, unless ``labels`` is None, a --labels option."""
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--train', default=TRAIN_PATH)
+    parser.add_argument('--valid', default=VALID_PATH)
+    parser.add_argument('--test', default=TEST_PATH)
+    if labels is not None:
+        parser.add_argument('--labels', type=int, nargs='+', default=list(labels), choices=LABELS)
+    return parser
+
+
+def load_shared(args):
+    """Return the shared preprocessing of the datasets named by parsed report arguments."""
+    return load_shared_preprocessing(args.train, args.valid, args.test)
+
+
+class LabelSplit:
+    """The training and validation rows of one label in the shared preprocessing, fitted and scored as a pipeline."""
+
+    def __init__(self, label, feature_names, arrays, correlated_features):
+        self.label = label
+        self.feature_names = feature_names
+        self.correlated_features = correlated_features
+        self.arrays = arrays
+        self.train_features = arrays['train_features']
+        self.train_rows, self.train_label = observed_rows(arrays, 'train', label)
+        self.valid_rows, self.valid_label = observed_rows(arrays, 'valid', label)
+        self.valid_features = arrays['valid_features'][self.valid_rows]
+
+    def fit(self, config=None, **kwargs):
+        """Return the label pipeline fitted with ``config`` (the label config by default)."""
+        return LabelPipeline(self.label, config).fit(self.train_features, self.train_label, self.feature_names,
+                                                     self.correlated_features, rows=self.train_rows, **kwargs)
+
+    def pca_features(self, pipeline):
+        """Return the PCA representation of the training and validation rows under a fitted pipeline."""
+        return pipeline.transform(self.train_features[self.train_rows]), pipeline.transform(self.valid_features)
+
+    def accuracy(self, model, features):
+        return accuracy_score(self.valid_label, model.predict(features))
+
+
+def label_splits(shared, labels, dtype=np.float64):
+    """Yield a LabelSplit for every label of ``labels``, on feature blocks in ``dtype``."""
+    feature_names, arrays, _ = label_arrays(shared, dtype)
+    for label in labels:
+        correlated_features = shared['correlated_features'][LABEL_CONFIGS[label]['correlation_threshold']]
+        yield LabelSplit(label, feature_names, arrays, correlated_features)
+
+
+def timed(function, *args, **kwargs):
+    """Return the result of ``function(*args, **kwargs)`` and its wall time in seconds."""
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def predictions_per_second(model, features, repeats=3):
+    """Return the best throughput of ``model.predict`` on ``features`` over ``repeats`` runs."""
+    return len(features) / min(timed(model.predict, features)[1] for _ in range(repeats))
+
+
+def print_table(rows, columns):
+    """Print ``rows`` under ``(header, key, width, format)`` columns, right aligned; None prints as '-'."""
+    print(' '.join('{:>{}}'.format(header, width) for header, _, width, _ in columns))
+    for row in rows:
+        print(' '.join('{:>{}}'.format('-' if row[key] is None else format(row[key], spec), width)
+                       for _, key, width, spec in columns))
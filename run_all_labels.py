@@ -0,0 +1,237 @@
+# Train the label 1-4 pipelines concurrently and write their prediction CSVs.
+#
+# The shared preprocessing stage runs once, its feature blocks are copied into
+# shared memory and every label pipeline runs in its own worker process pinned
+# to a disjoint set of cores.  Workers map the shared blocks instead of
+# receiving pickled copies of the datasets.  With a model directory, the fitted
+# pipelines are also saved as a new model version for score.py.
+#
+# Usage:
+#     python run_all_labels.py [--train PATH --valid PATH --test PATH] [--output-dir DIR] [--model-dir DIR]
+
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+from sklearn.metrics import accuracy_score
+from threadpoolctl import threadpool_limits
+
+from approximate_kernel import METHODS
+from batch_prediction import BatchPredictor
+from feature_ranking import RANKERS
+from imputation import labelled_rows
+from label_pipelines import LABEL_CONFIGS, LABELS, LabelPipeline, fit_shared_basis
+from model_artifacts import new_version, save_pipeline, write_manifest
+from pca_backends import BACKENDS
+from shared_preprocessing import (N_LABELS, PRECISIONS, TEST_PATH, TRAIN_PATH, VALID_PATH,
+                                  load_shared_preprocessing)
+from subsampling import METHODS as REDUCTION_METHODS
+from sv_compression import METHODS as COMPRESSION_METHODS
+from telemetry import stage
+
+OUTPUT_DIR = '/kaggle/working'
+OUTPUT_TEMPLATE = '190676J_label_{}.csv'
+
+
+def share_array(array):
+    """Copy ``array`` into a new shared memory block and return the block and its descriptor."""
+    block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    shared = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+    shared[...] = array
+    return block, (block.name, array.shape, array.dtype.str)
+
+
+def attach_array(descriptor):
+    """Map the shared memory block described by ``descriptor`` as a read-only array."""
+    name, shape, dtype = descriptor
+    block = shared_memory.SharedMemory(name=name)
+    array = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+    array.flags.writeable = False
+    return block, array
+
+
+def core_sets(n_groups):
+    """Split the cores available to this process into ``n_groups`` disjoint sets."""
+    cores = sorted(os.sched_getaffinity(0))
+    groups = np.array_split(cores, min(n_groups, len(cores)))
+    return [[int(core) for core in group] for group in groups]
+
+
+def run_label(label, descriptors, feature_names, correlated_features, ids, cores, output_dir,
+              approximation=None, version_dir=None, shared_basis=None, pca_backend='full', selection=None,
+              reduction=None, compression=None):
+    """Fit one label pipeline on the shared blocks, write its test predictions and return its validation accuracy."""
+    # Pin this worker and its BLAS threads to its own cores
+    os.sched_setaffinity(0, cores)
+
+    blocks = {}
+    arrays = {}
+    for key, descriptor in descriptors.items():
+        blocks[key], arrays[key] = attach_array(descriptor)
+
+    try:
+        with threadpool_limits(limits=len(cores)):
+            # Train on the rows where the label is observed, gathered together with the selected columns
+            train_rows, train_label = observed_rows(arrays, 'train', label)
+            config = dict(LABEL_CONFIGS[label], approximation=approximation, pca_backend=pca_backend,
+                          reduction=reduction, compression=compression, **(selection or {}))
+            pipeline = LabelPipeline(label, config).fit(arrays['train_features'], train_label, feature_names,
+                                                        correlated_features, shared_basis, rows=train_rows)
+
+            # Predict in chunks on the worker's cores, so the kernel blocks stay small; the predictor
+            # runs one thread per core and limits each to a single BLAS thread
+            valid_rows, valid_label = observed_rows(arrays, 'valid', label)
+            with BatchPredictor(pipeline, n_jobs=len(cores)) as predictor:
+                pred = predictor.predict(arrays['valid_features'][valid_rows])
+                accuracy = accuracy_score(valid_label, pred)
+
+                pred_test = predictor.predict(arrays['test_features'])
+    finally:
+        del arrays
+        for block in blocks.values():
+            block.close()
+
+    if version_dir is not None:
+        save_pipeline(pipeline, version_dir)
+
+    # Create the csv output file
+    with stage('export', label, len(ids), 2):
+        df = pd.DataFrame({'ID': ids, 'Label {}'.format(label): pred_test})
+        df.to_csv(os.path.join(output_dir, OUTPUT_TEMPLATE.format(label)), index=False)
+
+    return accuracy
+
+
+def label_arrays(shared, dtype=np.float64):
+    """Return the feature names, the NumPy feature blocks in ``dtype``, the label blocks and the test IDs."""
+    train_data = shared['train_data']
+    valid_data = shared['valid_data']
+    test_data = shared['test_data']
+
+    feature_names = list(train_data.columns[:-N_LABELS])
+    arrays = {
+        'train_features': train_data[feature_names].to_numpy(dtype=dtype),
+        'train_labels': shared['train_labels'].to_numpy(dtype=np.float64),
+        'valid_features': valid_data[feature_names].to_numpy(dtype=dtype),
+        'valid_labels': shared['valid_labels'].to_numpy(dtype=np.float64),
+        'test_features': test_data[feature_names].to_numpy(dtype=dtype),
+    }
+    return feature_names, arrays, test_data['ID'].to_numpy()
+
+
+def observed_rows(arrays, split, label):
+    """Return the positions of the rows of ``split`` where ``label`` is observed and the integer label values."""
+    values = arrays['{}_labels'.format(split)][:, label - 1]
+    rows = labelled_rows(values)
+    return rows, values[rows].astype(np.int64)
+
+
+def run_all_labels(train_path=TRAIN_PATH, valid_path=VALID_PATH, test_path=TEST_PATH,
+                   output_dir=OUTPUT_DIR, labels=LABELS, max_workers=None, approximation=None, model_dir=None,
+                   shared_pca=False, pca_backend='full', precision='float64', selection=None,
+                   reduction=None, compression=None):
+    """Run the label pipelines on a process pool and return their validation accuracies.
+
+    ``approximation`` holds the ``method`` and ``n_components`` of an
+    ApproximateKernelClassifier to train instead of the exact SVCs.  When
+    ``model_dir`` is given the fitted pipelines are saved there as a new version.
+    With ``shared_pca`` the labels project their PCA from one SharedPCABasis,
+    otherwise each fits its own with the ``pca_backend`` solver.  The feature
+    blocks are kept in the ``precision`` type of PRECISIONS from load to prediction.
+    ``selection`` holds the ``ranker`` and ``top_k`` that replace the correlation
+    threshold of the labels, and ``reduction`` the ``fraction`` and ``method``
+    of the class-balanced subset their models are fitted on.  ``compression``
+    holds the support-vector ``budget`` and ``method`` of the fitted SVCs.
+    """
+    shared = load_shared_preprocessing(train_path, valid_path, test_path,
+                                       precision=None if precision == 'float64' else precision)
+    feature_names, arrays, ids = label_arrays(shared, PRECISIONS[precision])
+    feature_means = shared['imputer'].means_
+    shared_basis = fit_shared_basis(arrays['train_features'], labels) if shared_pca else None
+    version_dir = os.path.join(model_dir, new_version()) if model_dir else None
+
+    max_workers = max_workers or len(labels)
+    cores = core_sets(max_workers)
+    os.makedirs(output_dir, exist_ok=True)
+
+    blocks = []
+    try:
+        descriptors = {}
+        for key, array in arrays.items():
+            block, descriptors[key] = share_array(array)
+            blocks.append(block)
+        del arrays
+
+        with ProcessPoolExecutor(max_workers=len(cores)) as pool:
+            futures = {
+                label: pool.submit(run_label, label, descriptors, feature_names,
+                                   shared['correlated_features'][LABEL_CONFIGS[label]['correlation_threshold']],
+                                   ids, cores[i % len(cores)], output_dir, approximation, version_dir,
+                                   shared_basis, pca_backend, selection, reduction, compression)
+                for i, label in enumerate(labels)
+            }
+            accuracies = {label: future.result() for label, future in futures.items()}
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+    if version_dir is not None:
+        write_manifest(version_dir, labels, feature_names, feature_means)
+    return accuracies
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Train the label 1-4 pipelines concurrently.')
+    parser.add_argument('--train', default=TRAIN_PATH)
+    parser.add_argument('--valid', default=VALID_PATH)
+    parser.add_argument('--test', default=TEST_PATH)
+    parser.add_argument('--output-dir', default=OUTPUT_DIR)
+    parser.add_argument('--labels', type=int, nargs='+', default=LABELS, choices=LABELS)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--approximate', choices=METHODS, default=None,
+                        help='train approximate-kernel models instead of the exact SVCs')
+    parser.add_argument('--n-components', type=int, default=1000)
+    parser.add_argument('--model-dir', default=None, help='save the fitted pipelines as a new model version here')
+    parser.add_argument('--shared-pca', action='store_true',
+                        help='derive every label PCA from one shared decomposition')
+    parser.add_argument('--pca-backend', choices=BACKENDS, default='full',
+                        help='PCA solver of the per-label fits')
+    parser.add_argument('--precision', choices=sorted(PRECISIONS), default='float64',
+                        help='floating point type of the feature blocks')
+    parser.add_argument('--ranker', choices=RANKERS, default=None,
+                        help='keep the top features of this ranker instead of the correlation threshold')
+    parser.add_argument('--top-k', type=float, default=0.9,
+                        help='features the ranker keeps, or a fraction below 1 of the total score')
+    parser.add_argument('--reduce', type=float, default=None,
+                        help='fit the models on this fraction of the rows of every class')
+    parser.add_argument('--reduce-method', choices=REDUCTION_METHODS, default='kmeans')
+    parser.add_argument('--sv-budget', type=float, default=None,
+                        help='compress the SVCs to this many support vectors, or a fraction below 1 of them')
+    parser.add_argument('--sv-method', choices=COMPRESSION_METHODS, default='alpha')
+    args = parser.parse_args()
+
+    approximation = None
+    if args.approximate:
+        approximation = {'method': args.approximate, 'n_components': args.n_components}
+    selection = None
+    if args.ranker:
+        selection = {'ranker': args.ranker, 'top_k': args.top_k}
+    reduction = None
+    if args.reduce:
+        reduction = {'fraction': args.reduce, 'method': args.reduce_method}
+    compression = None
+    if args.sv_budget:
+        compression = {'budget': args.sv_budget, 'method': args.sv_method}
+    accuracies = run_all_labels(args.train, args.valid, args.test, args.output_dir, args.labels, args.workers,
+                                approximation, args.model_dir, args.shared_pca, args.pca_backend,
+                                args.precision, selection, reduction, compression)
+    for label, accuracy in accuracies.items():
+        print("Label {} validation accuracy: {:.4f}".format(label, accuracy))
+
+
+if __name__ == '__main__':
+    main()
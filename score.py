@@ -0,0 +1,55 @@
+# Score raw feature rows with a saved model set without any training.
+#
+# The model set is loaded once and the input CSV is read in batches; each batch
+# is split into chunks that are imputed with the training means and predicted
+# for every label on a pool of threads or processes, and the predictions are
+# appended to the output CSV in input order as they are produced.  Memory is
+# bounded by the batch and chunk sizes, not by the size of the input file.
+#
+# Usage:
+#     python score.py input.csv predictions.csv [--model-dir DIR] [--version VERSION]
+#                     [--n-jobs N] [--chunk-size ROWS] [--executor thread|process]
+
+import argparse
+
+import pandas as pd
+
+from batch_prediction import EXECUTORS, BatchPredictor
+from binary_dataset import ID_COLUMN
+from model_artifacts import MODEL_DIR, load_model_set
+
+
+def score_csv(model_set, input_path, output_path, batch_size=10000, chunk_size=1024, n_jobs=None,
+              executor='thread'):
+    """Write the predictions of every label for the rows of ``input_path`` and return the row count."""
+    n_rows = 0
+    with BatchPredictor(model_set, chunk_size, n_jobs, executor) as predictor:
+        batches = pd.read_csv(input_path, chunksize=batch_size)
+        for i, (chunk, predictions) in enumerate(predictor.iter_predict(batches)):
+            if ID_COLUMN in chunk.columns:
+                predictions.insert(loc=0, column=ID_COLUMN, value=chunk[ID_COLUMN].to_numpy())
+            predictions.to_csv(output_path, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+            n_rows += len(chunk)
+    return n_rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Predict labels 1-4 for raw feature rows.')
+    parser.add_argument('input_path')
+    parser.add_argument('output_path')
+    parser.add_argument('--model-dir', default=MODEL_DIR)
+    parser.add_argument('--version', default=None, help='model version to load, the newest by default')
+    parser.add_argument('--batch-size', type=int, default=10000, help='rows read from the input at a time')
+    parser.add_argument('--chunk-size', type=int, default=1024, help='rows predicted per task')
+    parser.add_argument('--n-jobs', type=int, default=None, help='pool width, every available core by default')
+    parser.add_argument('--executor', choices=EXECUTORS, default='thread')
+    args = parser.parse_args()
+
+    model_set = load_model_set(args.model_dir, args.version)
+    n_rows = score_csv(model_set, args.input_path, args.output_path, args.batch_size, args.chunk_size,
+                       args.n_jobs, args.executor)
+    print("Scored {} rows with model version {} into {}".format(n_rows, model_set.version, args.output_path))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+# Shared PCA basis for the label 1-4 pipelines.
+#
+# Every label script fits its own PCA(svd_solver='full') on a column subset of
+# the same standardized training matrix, so the expensive O(n * d^2) pass over
+# the rows runs four times.  The scalers work column by column, so scaling a
+# column subset equals taking that subset of the scaled matrix, and the
+# covariance of a subset is the matching block of the full covariance.
+# SharedPCABasis therefore standardizes the training matrix and computes its
+# covariance once per scaler type; each label's PCA is then the eigen-
+# decomposition of its masked d_label x d_label block, with no further pass
+# over the rows.  On the same training rows it reproduces the per-label PCA
+# up to the sign of the components.
+#
+# Usage (prints the shared vs per-label PCA report for every label):
+#     python shared_pca.py
+
+import copy
+
+import numpy as np
+
+
+class ProjectedPCA:
+    """PCA fitted from a block of a shared covariance matrix, with the attributes of a fitted sklearn PCA."""
+
+    whiten = False
+
+    def __init__(self, components, mean, explained_variance, explained_variance_ratio):
+        self.components_ = components
+        self.mean_ = mean
+        self.explained_variance_ = explained_variance
+        self.explained_variance_ratio_ = explained_variance_ratio
+        self.n_components_ = components.shape[0]
+
+    def transform(self, X):
+        return (np.asarray(X) - self.mean_) @ self.components_.T
+
+
+def subset_scaler(scaler, feature_indices):
+    """Return a copy of a fitted RobustScaler/StandardScaler restricted to ``feature_indices``."""
+    subset = copy.copy(scaler)
+    for attribute in ('center_', 'mean_', 'var_', 'scale_'):
+        value = getattr(scaler, attribute, None)
+        if value is not None:
+            setattr(subset, attribute, value[feature_indices])
+    subset.n_features_in_ = len(feature_indices)
+    return subset
+
+
+class SharedPCABasis:
+    """Standardization and covariance of the shared training matrix, fitted once per scaler type."""
+
+    def __init__(self, scalers):
+        self.scalers = scalers
+
+    def fit(self, features):
+        """Fit every scaler on all feature columns and compute the covariance of its output."""
+        self.scalers_ = {}
+        self.means_ = {}
+        self.covariances_ = {}
+        for name, scaler in self.scalers.items():
+            # Accumulate the covariance in float64 whatever the precision of the features
+            standardized = np.asarray(scaler.fit_transform(features), dtype=np.float64)
+            mean = standardized.mean(axis=0)
+            standardized -= mean
+            self.scalers_[name] = scaler
+            self.means_[name] = mean
+            self.covariances_[name] = standardized.T @ standardized / (features.shape[0] - 1)
+        return self
+
+    def projection(self, scaler, feature_indices, variance_threshold):
+        """Return the scaler and PCA of the ``feature_indices`` columns under the ``scaler`` type.
+
+        Components are kept until they explain more than ``variance_threshold`` of
+        the variance, the rule of ``PCA(n_components=variance_threshold)``.
+        """
+        covariance = self.covariances_[scaler][np.ix_(feature_indices, feature_indices)]
+        eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+
+        # eigh sorts ascending; clip the round-off below zero
+        eigenvalues = np.clip(eigenvalues[::-1], 0, None)
+        eigenvectors = eigenvectors[:, ::-1]
+        ratio = eigenvalues / eigenvalues.sum()
+        n_components = min(int(np.searchsorted(np.cumsum(ratio), variance_threshold, side='right')) + 1,
+                           len(feature_indices))
+
+        # Make the largest coefficient of every component positive, like svd_flip
+        components = eigenvectors[:, :n_components].T
+        signs = np.sign(components[np.arange(n_components), np.abs(components).argmax(axis=1)])
+        components = components * signs[:, None]
+
+        pca = ProjectedPCA(components, self.means_[scaler][feature_indices],
+                           eigenvalues[:n_components], ratio[:n_components])
+        return subset_scaler(self.scalers_[scaler], feature_indices), pca
+
+
+SEPARATE_COLUMNS = [
+    ('label', 'label', 5, ''), ('mode', 'mode', 9, ''), ('n_components', 'n_components', 12, ''),
+    ('accuracy', 'accuracy', 9, '.4f'), ('fit (s)', 'fit_seconds', 10, '.3f'),
+]
+
+
+def compare_with_separate_pca(shared, labels):
+    """Return one row per label comparing per-label PCA with projections of the shared basis."""
+    from label_pipelines import fit_shared_basis
+    from reports import label_splits, timed
+
+    splits = list(label_splits(shared, labels))
+    # Every split holds the same feature blocks
+    basis, basis_time = timed(fit_shared_basis, splits[0].train_features, labels)
+
+    rows = []
+    for split in splits:
+        for mode, label_basis in (('separate', None), ('shared', basis)):
+            pipeline, fit_time = timed(split.fit, shared_basis=label_basis)
+            rows.append({'label': split.label, 'mode': mode, 'n_components': pipeline.pca.n_components_,
+                         'accuracy': split.accuracy(pipeline, split.valid_features), 'fit_seconds': fit_time})
+    return rows, basis_time
+
+
+def main():
+    from reports import load_shared, print_table, report_parser
+
+    args = report_parser('Compare per-label PCA with the shared PCA basis.').parse_args()
+
+    rows, basis_time = compare_with_separate_pca(load_shared(args), args.labels)
+    print("Shared basis fitted once in {:.3f}s".format(basis_time))
+    print_table(rows, SEPARATE_COLUMNS)
+
+
+if __name__ == '__main__':
+    main()
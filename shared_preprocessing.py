@@ -0,0 +1,183 @@
+# Shared preprocessing stage for the label 1-4 pipelines.
+#
+# Loading the train, valid and test datasets, imputing their null features with
+# the training means and computing the correlation matrix of the training
+# features is identical for every label, so it is done once and persisted to an
+# on-disk cache.  Label columns are never imputed; rows with a missing label
+# stay in the datasets and each label filters them when it gathers its rows.  Cache
+# entries are keyed by the content digests of the input files and by the
+# thresholds used to identify highly correlated features, so a changed dataset
+# or threshold never reuses stale artifacts.  Every dataset path may point
+# either to a CSV file or to a directory written by binary_dataset.py.  In the
+# float32 precision mode the feature columns are loaded as float32; the
+# correlation matrix is still accumulated in float64 by pandas.
+
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from binary_dataset import is_binary_dataset, load_binary_dataset, split_columns
+from feature_selection import find_correlated_features
+from imputation import MeanImputer
+from telemetry import stage
+
+# File paths for the datasets
+DATASET_DIR = '/kaggle/input/audiomintest-layer7-dataset'
+TRAIN_PATH = os.path.join(DATASET_DIR, 'train.csv')
+VALID_PATH = os.path.join(DATASET_DIR, 'valid.csv')
+TEST_PATH = os.path.join(DATASET_DIR, 'test.csv')
+
+# Directory holding the cached artifacts
+CACHE_DIR = os.environ.get('LAYER7_CACHE_DIR', '/kaggle/working/layer7_cache')
+
+# Bump whenever the layout of the cached artifacts changes
+CACHE_VERSION = 4
+
+# Number of label columns at the end of the train and valid datasets
+N_LABELS = 4
+
+# Thresholds used by the label scripts to identify inter-correlated features
+CORRELATION_THRESHOLDS = (0.9, 0.95)
+
+# Floating point types the feature blocks can be kept in
+PRECISIONS = {
+    'float64': np.float64,
+    'float32': np.float32,
+}
+
+
+def file_digest(path, block_size=1 << 20):
+    """Return the SHA-256 hex digest of the file at ``path``."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def dataset_digest(path):
+    """Return the content digest of a CSV file or of the CSV a binary dataset was converted from."""
+    # Binary datasets hold float32 features, so they must not share entries with their source CSV
+    if is_binary_dataset(path):
+        return 'binary:' + load_binary_dataset(path).source_digest
+    return file_digest(path)
+
+
+def read_dataset(path, dtype=None):
+    """Load a CSV file or a binary dataset directory as a DataFrame, with the feature columns in ``dtype``."""
+    if is_binary_dataset(path):
+        # Copy-on-write, so imputing in place only copies the pages it fills
+        data = load_binary_dataset(path, mmap_mode='c').to_frame()
+        if dtype is not None:
+            _, _, feature_columns = split_columns(data.columns)
+            data = data.astype({column: dtype for column in feature_columns}, copy=False)
+        return data
+    if dtype is None:
+        return pd.read_csv(path)
+
+    # Parse the features straight into ``dtype`` instead of converting a float64 frame
+    _, _, feature_columns = split_columns(pd.read_csv(path, nrows=0).columns)
+    return pd.read_csv(path, dtype={column: dtype for column in feature_columns})
+
+
+def cache_key(paths, correlation_thresholds, drop_missing_labels, precision=None):
+    """Return the cache key for the given input files and preprocessing options."""
+    key = {
+        'version': CACHE_VERSION,
+        'files': [dataset_digest(path) for path in paths],
+        'correlation_thresholds': sorted(float(t) for t in correlation_thresholds),
+        'drop_missing_labels': bool(drop_missing_labels),
+    }
+    # Entries of the default precision keep the keys they had before precision modes existed
+    if precision is not None:
+        key['precision'] = precision
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+
+def build_shared_preprocessing(train_path=TRAIN_PATH, valid_path=VALID_PATH, test_path=TEST_PATH,
+                               correlation_thresholds=CORRELATION_THRESHOLDS, drop_missing_labels=False,
+                               precision=None):
+    """Load, impute and analyse the datasets without touching the cache."""
+    dtype = PRECISIONS[precision] if precision is not None else None
+
+    # Load the train, valid and test datasets
+    with stage('load') as record:
+        train_data = read_dataset(train_path, dtype)
+        valid_data = read_dataset(valid_path, dtype)
+        test_data = read_dataset(test_path, dtype)
+        record.update(rows=len(train_data) + len(valid_data) + len(test_data), columns=train_data.shape[1])
+
+    # Assess the presence of null values in the training dataset
+    train_null_counts = train_data.isnull().sum()
+
+    # Drop rows with null values in the final four columns (target labels) for train dataset
+    if drop_missing_labels:
+        train_data = train_data.dropna(subset=train_data.columns[-N_LABELS:], how='any')
+
+    # Keep the label columns, with their missing values, as separate frames
+    train_labels = train_data.iloc[:, -N_LABELS:].copy()
+    valid_labels = valid_data.iloc[:, -N_LABELS:].copy()
+
+    # Replace null features in every dataset with the means of the training features
+    with stage('impute', rows=len(train_data) + len(valid_data) + len(test_data), columns=train_data.shape[1]):
+        imputer = MeanImputer(train_data.columns[:-N_LABELS]).fit(train_data)
+        for data in (train_data, valid_data, test_data):
+            imputer.transform(data)
+
+    with stage('correlation', rows=len(train_data), columns=train_data.shape[1] - N_LABELS):
+        # Compute the correlation matrix among the training features
+        correlation_matrix = train_data.iloc[:, :-N_LABELS].corr()
+
+        # Identify highly correlated features for every requested threshold
+        correlated_features = {
+            float(threshold): find_correlated_features(correlation_matrix, threshold)
+            for threshold in correlation_thresholds
+        }
+
+    return {
+        'train_data': train_data,
+        'valid_data': valid_data,
+        'test_data': test_data,
+        'train_labels': train_labels,
+        'valid_labels': valid_labels,
+        'train_null_counts': train_null_counts,
+        'imputer': imputer,
+        'correlation_matrix': correlation_matrix,
+        'correlated_features': correlated_features,
+    }
+
+
+def load_shared_preprocessing(train_path=TRAIN_PATH, valid_path=VALID_PATH, test_path=TEST_PATH,
+                              correlation_thresholds=CORRELATION_THRESHOLDS, drop_missing_labels=False,
+                              cache_dir=CACHE_DIR, precision=None):
+    """Return the shared preprocessing artifacts, computing them only on a cache miss.
+
+    The returned dictionary holds the ``train_data``, ``valid_data`` and
+    ``test_data`` imputed with the training means, the ``train_labels`` and
+    ``valid_labels``, the ``train_null_counts`` of the raw training dataset, the
+    fitted ``imputer``, the
+    training ``correlation_matrix`` and the ``correlated_features`` found for
+    each threshold in ``correlation_thresholds``.  A ``precision`` from
+    PRECISIONS loads the feature columns in that type; by default they keep
+    the type of the source files.
+    """
+    key = cache_key([train_path, valid_path, test_path], correlation_thresholds, drop_missing_labels, precision)
+    cache_path = os.path.join(cache_dir, '{}.pkl'.format(key))
+
+    if os.path.exists(cache_path):
+        with stage('cache_load'):
+            return pd.read_pickle(cache_path)
+
+    artifacts = build_shared_preprocessing(train_path, valid_path, test_path,
+                                           correlation_thresholds, drop_missing_labels, precision)
+
+    # Write to a temporary file first so concurrent label runs never read a partial entry
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = '{}.{}.tmp'.format(cache_path, os.getpid())
+    pd.to_pickle(artifacts, tmp_path)
+    os.replace(tmp_path, cache_path)
+
+    return artifacts
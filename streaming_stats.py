@@ -0,0 +1,199 @@
+# Single-pass streaming statistics for datasets larger than memory.
+#
+# The label pipelines need the training feature means (for imputation), the
+# correlation matrix of the mean-imputed features and the correlation of every
+# feature with each label.  StreamingStats accumulates all three from row
+# chunks of a CSV file or binary dataset.  Means are updated with Chan's
+# parallel form of Welford's algorithm, and every co-moment is kept centred on
+# the running means and re-centred when they move, so no large raw sums are
+# ever subtracted from each other.
+#
+# The results match the in-memory computation of the label scripts:
+#   means                 == train_features.mean()
+#   correlation()         == train_features.fillna(means).corr()
+#   label_correlation()   == train_features.fillna(means).corrwith(train_labelN)
+
+import numpy as np
+import pandas as pd
+
+from binary_dataset import is_binary_dataset, load_binary_dataset, split_columns
+from imputation import MeanImputer
+
+
+class StreamingStats:
+    """Accumulate feature means, covariances and feature-label correlations chunk by chunk."""
+
+    def __init__(self, feature_names, label_names=()):
+        self.feature_names = list(feature_names)
+        self.label_names = list(label_names)
+        n_features = len(self.feature_names)
+        n_labels = len(self.label_names)
+
+        # Rows seen so far, observed values per feature and their running means
+        self.n_rows = 0
+        self.feature_counts = np.zeros(n_features)
+        self.feature_means = np.zeros(n_features)
+
+        # Co-moments of the features over rows where both features are observed
+        self._comoment = np.zeros((n_features, n_features))
+        self._first_moment = np.zeros((n_features, n_features))
+        self._pair_counts = np.zeros((n_features, n_features))
+
+        # Rows with an observed label, their running means and centred moments
+        self.label_counts = np.zeros(n_labels)
+        self.label_means = np.zeros(n_labels)
+        self._label_first = np.zeros(n_labels)
+        self._label_second = np.zeros(n_labels)
+
+        # Feature moments over the rows where each label is observed
+        self._label_feature_counts = np.zeros((n_features, n_labels))
+        self._label_feature_first = np.zeros((n_features, n_labels))
+        self._label_feature_second = np.zeros((n_features, n_labels))
+        self._label_feature_cross = np.zeros((n_features, n_labels))
+        self._label_feature_label_first = np.zeros((n_features, n_labels))
+
+    def update(self, features, labels=None):
+        """Add a chunk of ``features`` (NaN for missing values) and its ``labels``."""
+        features = np.asarray(features, dtype=np.float64)
+        observed = ~np.isnan(features)
+        mask = observed.astype(np.float64)
+
+        # Update the feature means with the chunk means (Chan et al.)
+        chunk_counts = mask.sum(axis=0)
+        counts = self.feature_counts + chunk_counts
+        chunk_sums = np.where(observed, features, 0.0).sum(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            chunk_means = np.where(chunk_counts > 0, chunk_sums / chunk_counts, 0.0)
+            weights = np.where(counts > 0, chunk_counts / counts, 0.0)
+        feature_shift = (chunk_means - self.feature_means) * weights
+        self.feature_means = self.feature_means + feature_shift
+        self.feature_counts = counts
+        self.n_rows += features.shape[0]
+
+        # Re-centre the feature co-moments on the new means
+        shift_first = self._first_moment * feature_shift[None, :]
+        self._comoment += (self._pair_counts * np.outer(feature_shift, feature_shift)
+                           - shift_first - shift_first.T)
+        self._first_moment -= feature_shift[:, None] * self._pair_counts
+
+        # Add the chunk, centred on the new means; missing values contribute nothing
+        centred = np.where(observed, features - self.feature_means, 0.0)
+        self._comoment += centred.T @ centred
+        self._first_moment += centred.T @ mask
+        self._pair_counts += mask.T @ mask
+
+        if self.label_names:
+            self._update_labels(centred, mask, feature_shift, labels)
+
+    def _update_labels(self, centred, mask, feature_shift, labels):
+        labels = np.asarray(labels, dtype=np.float64).reshape(centred.shape[0], -1)
+        label_observed = ~np.isnan(labels)
+        label_mask = label_observed.astype(np.float64)
+
+        # Update the label means over the rows where each label is observed
+        chunk_counts = label_mask.sum(axis=0)
+        counts = self.label_counts + chunk_counts
+        chunk_sums = np.where(label_observed, labels, 0.0).sum(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            chunk_means = np.where(chunk_counts > 0, chunk_sums / chunk_counts, 0.0)
+            weights = np.where(counts > 0, chunk_counts / counts, 0.0)
+        label_shift = (chunk_means - self.label_means) * weights
+        self.label_means = self.label_means + label_shift
+        previous_counts = self.label_counts
+        self.label_counts = counts
+
+        # Re-centre the label moments on the new label means
+        self._label_second += label_shift ** 2 * previous_counts - 2 * label_shift * self._label_first
+        self._label_first -= label_shift * previous_counts
+
+        # Re-centre the feature moments over the label rows on the new feature and label means
+        feature_shift = feature_shift[:, None]
+        label_shift = label_shift[None, :]
+        self._label_feature_cross += (feature_shift * label_shift * self._label_feature_counts
+                                      - label_shift * self._label_feature_first
+                                      - feature_shift * self._label_feature_label_first)
+        self._label_feature_second += (feature_shift ** 2 * self._label_feature_counts
+                                       - 2 * feature_shift * self._label_feature_first)
+        self._label_feature_first -= feature_shift * self._label_feature_counts
+        self._label_feature_label_first -= label_shift * self._label_feature_counts
+
+        # Add the chunk, restricted to the rows where each label is observed
+        centred_labels = np.where(label_observed, labels - self.label_means, 0.0)
+        self._label_first += centred_labels.sum(axis=0)
+        self._label_second += (centred_labels ** 2).sum(axis=0)
+        self._label_feature_counts += mask.T @ label_mask
+        self._label_feature_first += centred.T @ label_mask
+        self._label_feature_second += (centred ** 2).T @ label_mask
+        self._label_feature_cross += centred.T @ centred_labels
+        self._label_feature_label_first += mask.T @ centred_labels
+
+    @property
+    def means(self):
+        """Means of the observed values of every feature."""
+        means = np.where(self.feature_counts > 0, self.feature_means, np.nan)
+        return pd.Series(means, index=self.feature_names)
+
+    def imputer(self):
+        """Return a MeanImputer holding the streamed training means."""
+        imputer = MeanImputer(self.feature_names)
+        imputer.sums_ = self.feature_means * self.feature_counts
+        imputer.counts_ = self.feature_counts.astype(np.int64)
+        return imputer
+
+    def covariance(self):
+        """Covariance matrix of the mean-imputed features."""
+        return pd.DataFrame(self._comoment / (self.n_rows - 1),
+                            index=self.feature_names, columns=self.feature_names)
+
+    def correlation(self):
+        """Correlation matrix of the mean-imputed features."""
+        std = np.sqrt(np.diag(self._comoment))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            correlation = self._comoment / np.outer(std, std)
+        return pd.DataFrame(correlation, index=self.feature_names, columns=self.feature_names)
+
+    def label_correlation(self):
+        """Correlation of every mean-imputed feature with each label over the rows where it is observed."""
+        # Imputed values equal the final means, so they enter every sum centred at zero
+        n = self.label_counts[None, :]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            feature_variance = self._label_feature_second - self._label_feature_first ** 2 / n
+            label_variance = self._label_second - self._label_first ** 2 / self.label_counts
+            covariance = self._label_feature_cross - self._label_feature_first * self._label_first[None, :] / n
+            correlation = covariance / np.sqrt(feature_variance * label_variance[None, :])
+        return pd.DataFrame(correlation, index=self.feature_names, columns=self.label_names)
+
+
+def iter_chunks(path, chunksize=10000, drop_missing_labels=False):
+    """Yield ``(feature_names, label_names, features, labels)`` row chunks of a CSV file or binary dataset."""
+    if is_binary_dataset(path):
+        dataset = load_binary_dataset(path)
+        for start in range(0, len(dataset), chunksize):
+            features = dataset.features[start:start + chunksize]
+            labels = dataset.labels[start:start + chunksize]
+            yield _drop_missing(dataset.feature_names, dataset.label_names, features, labels, drop_missing_labels)
+        return
+
+    for chunk in pd.read_csv(path, chunksize=chunksize):
+        _, label_names, feature_names = split_columns(list(chunk.columns))
+        features = chunk[feature_names].to_numpy(dtype=np.float64)
+        labels = chunk[label_names].to_numpy(dtype=np.float64)
+        yield _drop_missing(feature_names, label_names, features, labels, drop_missing_labels)
+
+
+def _drop_missing(feature_names, label_names, features, labels, drop_missing_labels):
+    # Drop rows with null values in any label column, like label2.py does
+    if drop_missing_labels and labels.shape[1]:
+        keep = ~np.isnan(labels).any(axis=1)
+        features, labels = features[keep], labels[keep]
+    return feature_names, label_names, features, labels
+
+
+def compute_streaming_stats(path, chunksize=10000, drop_missing_labels=False):
+    """Return the StreamingStats of the dataset at ``path`` computed in one pass over row chunks."""
+    stats = None
+    for feature_names, label_names, features, labels in iter_chunks(path, chunksize, drop_missing_labels):
+        if stats is None:
+            stats = StreamingStats(feature_names, label_names)
+        stats.update(features, labels)
+    return stats
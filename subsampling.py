@@ -0,0 +1,140 @@
+# Class-balanced training-set reduction for the SVC of a label pipeline.
+#
+# Kernel SVC training grows faster than linearly with the number of rows, and
+# labels 1 and 4 are fitted on the whole training set.  A reduction keeps a
+# ``fraction`` of the rows of every class, in PCA space, before the SVC is fitted:
+#
+#   random  a stratified random sample of every class
+#   kmeans  per class, the rows nearest to the centroids of a mini-batch k-means
+#           clustering of that class, so the kept rows cover the whole class
+#           region.  At most ``MAX_CENTROIDS`` clusters are fitted, so the cost
+#           stays linear in the class size; the clusters share the rows to keep
+#           in proportion to their sizes.
+#
+# Every class keeps the same fraction of its rows, so the class proportions and
+# the 'balanced' class weights of label 4 are unchanged, but never fewer than
+# ``min_per_class`` rows (or all of them).  The scaler and PCA are still fitted
+# on every training row.
+#
+# Usage (prints validation accuracy against reduction plus SVC fit time for every fraction):
+#     python subsampling.py [--labels 1 4] [--fractions 0.1 0.25 0.5 1]
+
+import numpy as np
+from sklearn.cluster import MiniBatchKMeans
+
+METHODS = ('random', 'kmeans')
+
+# Most clusters fitted per class by the kmeans method
+MAX_CENTROIDS = 256
+
+
+def allocate_budget(counts, total, minimum=0):
+    """Split ``total`` between groups of ``counts`` items in proportion to their sizes.
+
+    Every group first gets ``minimum`` items (or all of its items) and the rest
+    is shared by largest remainders, so the shares never exceed a group's count
+    and add up to exactly ``total`` (or to every item when there are fewer).
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    shares = np.minimum(counts, minimum)
+    remaining = counts - shares
+    total = min(int(total), int(counts.sum())) - int(shares.sum())
+    if total <= 0:
+        return shares
+    quotas = total * remaining / remaining.sum()
+    extra = np.floor(quotas).astype(np.int64)
+    # Hand the rows lost to rounding to the largest remainders
+    order = np.argsort(-(quotas - extra), kind='stable')
+    extra[order[:total - int(extra.sum())]] += 1
+    return shares + extra
+
+
+def class_budgets(labels, fraction, min_per_class=10):
+    """Return ``{class: rows to keep}``: ``fraction`` of every class, at least ``min_per_class`` or the whole class."""
+    classes, counts = np.unique(labels, return_counts=True)
+    budgets = np.maximum(np.rint(counts * fraction).astype(np.int64), np.minimum(counts, min_per_class))
+    return dict(zip(classes, budgets))
+
+
+def class_prototypes(features, n_prototypes, random_state=0, max_centroids=MAX_CENTROIDS):
+    """Return the positions of ``n_prototypes`` rows of ``features`` that cover its k-means clusters.
+
+    ``features`` is clustered into at most ``max_centroids`` clusters; each
+    cluster keeps its share of ``n_prototypes``, at least one row, taking the
+    rows nearest to its centroid first.
+    """
+    n_clusters = min(n_prototypes, max_centroids, len(features))
+    kmeans = MiniBatchKMeans(n_clusters=n_clusters, n_init=1, random_state=random_state).fit(features)
+    clusters = kmeans.labels_
+    distances = np.linalg.norm(features - kmeans.cluster_centers_[clusters], axis=1)
+    shares = allocate_budget(np.bincount(clusters, minlength=n_clusters), n_prototypes, minimum=1)
+
+    # Sort the rows by cluster and, within a cluster, by distance to its centroid
+    order = np.lexsort((distances, clusters))
+    starts = np.searchsorted(clusters[order], np.arange(n_clusters))
+    return np.sort(np.concatenate([order[start:start + share] for start, share in zip(starts, shares)]))
+
+
+def reduce_training_set(features, labels, fraction, method='kmeans', min_per_class=10, random_state=0):
+    """Return the sorted positions of the training rows kept by the reduction."""
+    if method not in METHODS:
+        raise ValueError("Unknown reduction method {!r}, expected one of {}".format(method, METHODS))
+    labels = np.asarray(labels)
+    rng = np.random.default_rng(random_state)
+    kept = []
+    for cls, budget in class_budgets(labels, fraction, min_per_class).items():
+        rows = np.flatnonzero(labels == cls)
+        if budget >= len(rows):
+            kept.append(rows)
+        elif method == 'random':
+            kept.append(rng.choice(rows, budget, replace=False))
+        else:
+            kept.append(rows[class_prototypes(features[rows], budget, random_state)])
+    return np.sort(np.concatenate(kept))
+
+
+REDUCTION_COLUMNS = [
+    ('label', 'label', 5, ''), ('method', 'method', 7, ''), ('fraction', 'fraction', 9, '.2f'),
+    ('rows', 'n_rows', 7, ''), ('reduce (s)', 'reduce_seconds', 11, '.3f'), ('fit (s)', 'fit_seconds', 8, '.3f'),
+    ('total (s)', 'seconds', 10, '.3f'), ('accuracy', 'accuracy', 9, '.4f'),
+]
+
+
+def reduction_curve(shared, labels, fractions, methods=METHODS):
+    """Return one row per label, method and fraction with the kept rows, timings and validation accuracy.
+
+    ``seconds``, the time axis of the curve, covers the reduction and the SVC fit.
+    """
+    from label_pipelines import LABEL_CONFIGS, make_model
+    from reports import label_splits, timed
+
+    rows = []
+    for split in label_splits(shared, labels):
+        # The reduction runs after selection, scaling and PCA, which are shared by every point of the curve
+        config = LABEL_CONFIGS[split.label]
+        pca_train_result, pca_valid_result = split.pca_features(split.fit())
+
+        for method in methods:
+            for fraction in sorted(fractions):
+                kept, reduce_time = timed(reduce_training_set, pca_train_result, split.train_label, fraction, method)
+                model, fit_time = timed(make_model(config).fit, pca_train_result[kept], split.train_label[kept])
+                rows.append({'label': split.label, 'method': method, 'fraction': fraction, 'n_rows': len(kept),
+                             'reduce_seconds': reduce_time, 'fit_seconds': fit_time,
+                             'seconds': reduce_time + fit_time,
+                             'accuracy': split.accuracy(model, pca_valid_result)})
+    return rows
+
+
+def main():
+    from reports import load_shared, print_table, report_parser
+
+    parser = report_parser('Plot validation accuracy against reduction and SVC fit time.', labels=[1, 4])
+    parser.add_argument('--methods', nargs='+', default=list(METHODS), choices=METHODS)
+    parser.add_argument('--fractions', type=float, nargs='+', default=[0.1, 0.25, 0.5, 1.0])
+    args = parser.parse_args()
+
+    print_table(reduction_curve(load_shared(args), args.labels, args.fractions, args.methods), REDUCTION_COLUMNS)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+# Support-vector compression of fitted label SVCs.
+#
+# SVC prediction evaluates the kernel against every support vector, and with
+# C=1000 labels 2 and 4 keep thousands of them.  Compression is a reduced-set
+# method: it prunes the support set to a ``budget`` and refits the coefficients
+# of every one-vs-one decision function on the kept vectors, by least squares
+# against the decision values of the original SVC on the training rows of the
+# two classes.  The support vectors to keep are chosen per class, in proportion
+# to the support vectors of the class:
+#
+#   alpha   the support vectors with the largest dual coefficients
+#   kmeans  the support vectors nearest to per-class k-means centroids of the
+#           support set (the prototypes of subsampling.py)
+#
+# A budget below 1 is a fraction of the current support set.  CompressedSVC
+# evaluates the kernel once against the kept vectors and votes like SVC.
+#
+# Usage (prints support vectors, predictions per second and accuracy before and after):
+#     python sv_compression.py [--labels 2 4] [--budgets 0.25 0.5]
+
+import copy
+
+import numpy as np
+from sklearn.base import BaseEstimator, ClassifierMixin
+from sklearn.metrics.pairwise import rbf_kernel
+
+from kernel_cache import class_pairs, ovo_votes, resolve_gamma
+from subsampling import allocate_budget, class_prototypes
+
+METHODS = ('alpha', 'kmeans')
+
+
+def support_budget(model, budget):
+    """Return the number of support vectors a ``budget`` allows for ``model``."""
+    n_support = len(model.support_vectors_)
+    if budget < 1:
+        return max(int(round(budget * n_support)), len(model.classes_))
+    return min(int(budget), n_support)
+
+
+def ovo_decision(model, features):
+    """Return the one-vs-one decision values of a fitted SVC, positive for the first class of every pair."""
+    # A shallow copy reads the one-vs-one shape without changing the caller's model
+    decision = copy.copy(model).set_params(decision_function_shape='ovo').decision_function(features)
+    if len(model.classes_) == 2:
+        # The binary decision function of SVC is positive for the second class
+        return -decision.reshape(-1, 1)
+    return decision
+
+
+class CompressedSVC(ClassifierMixin, BaseEstimator):
+    """One-vs-one RBF decision functions over a reduced set of support vectors."""
+
+    def __init__(self, support_vectors, gamma, classes, coef, intercept):
+        self.support_vectors = support_vectors
+        self.gamma = gamma
+        self.classes = classes
+        self.coef = coef
+        self.intercept = intercept
+
+    @property
+    def support_vectors_(self):
+        return self.support_vectors
+
+    @property
+    def classes_(self):
+        return self.classes
+
+    def predict(self, features):
+        decision = rbf_kernel(features, self.support_vectors, gamma=self.gamma) @ self.coef + self.intercept
+        # Ties go to the first class, as in libsvm
+        return self.classes[ovo_votes(decision).argmax(axis=1)]
+
+
+def select_support_vectors(model, labels, n_keep, method='alpha', random_state=0):
+    """Return the positions in ``model.support_`` of the ``n_keep`` support vectors to keep.
+
+    The classes share ``n_keep`` in proportion to their support vectors, with at
+    least one each when the budget allows, so exactly ``n_keep`` are returned.
+    """
+    if method not in METHODS:
+        raise ValueError("Unknown compression method {!r}, expected one of {}".format(method, METHODS))
+    support_labels = np.asarray(labels)[model.support_]
+    # Every support vector contributes one coefficient per opposing class
+    weights = np.abs(model.dual_coef_).sum(axis=0)
+
+    classes, counts = np.unique(support_labels, return_counts=True)
+    shares = allocate_budget(counts, n_keep, minimum=1 if n_keep >= len(classes) else 0)
+    kept = []
+    for cls, n_class in zip(classes, shares):
+        rows = np.flatnonzero(support_labels == cls)
+        if n_class >= len(rows):
+            kept.append(rows)
+        elif method == 'alpha':
+            kept.append(rows[np.argsort(-weights[rows], kind='stable')[:n_class]])
+        else:
+            kept.append(rows[class_prototypes(model.support_vectors_[rows], n_class, random_state)])
+    return np.sort(np.concatenate(kept))
+
+
+def compress_svc(model, features, labels, budget, method='alpha', random_state=0):
+    """Return a CompressedSVC with at most ``budget`` of the support vectors of a fitted RBF SVC.
+
+    ``features`` and ``labels`` are the rows the model was fitted on, which also
+    resolve its gamma.  The model is returned unchanged when it is within the
+    budget already.
+    """
+    n_keep = support_budget(model, budget)
+    if n_keep >= len(model.support_vectors_):
+        return model
+
+    labels = np.asarray(labels)
+    kept = select_support_vectors(model, labels, n_keep, method, random_state)
+    support_vectors = model.support_vectors_[kept]
+    support_labels = labels[model.support_][kept]
+
+    # Fit every pair's coefficients and intercept to the original decision values on the rows of its two classes
+    gamma = resolve_gamma(model.gamma, features)
+    decision = ovo_decision(model, features)
+    kernel = rbf_kernel(features, support_vectors, gamma=gamma)
+    pairs = class_pairs(len(model.classes_))
+    coef = np.zeros((len(kept), len(pairs)))
+    intercept = np.zeros(len(pairs))
+    for pair, (i, j) in enumerate(pairs):
+        pair_classes = model.classes_[[i, j]]
+        rows = np.flatnonzero(np.isin(labels, pair_classes))
+        columns = np.flatnonzero(np.isin(support_labels, pair_classes))
+        design = np.hstack([kernel[np.ix_(rows, columns)], np.ones((len(rows), 1))])
+        solution = np.linalg.lstsq(design, decision[rows, pair], rcond=1e-8)[0]
+        coef[columns, pair] = solution[:-1]
+        intercept[pair] = solution[-1]
+    return CompressedSVC(support_vectors, gamma, model.classes_, coef, intercept)
+
+
+COMPRESSION_COLUMNS = [
+    ('label', 'label', 5, ''), ('method', 'method', 7, ''), ('budget', 'budget', 7, 'g'),
+    ('n_support', 'n_support', 10, ''), ('compress (s)', 'compress_seconds', 13, '.3f'),
+    ('rows/s', 'rows_per_second', 10, '.0f'), ('accuracy', 'accuracy', 9, '.4f'),
+]
+
+
+def compare_compression(shared, labels, budgets, methods=METHODS):
+    """Return one row per label, method and budget with support vectors, throughput and validation accuracy.
+
+    The first row of every label is the uncompressed SVC.
+    """
+    from reports import label_splits, predictions_per_second, timed
+
+    rows = []
+    for split in label_splits(shared, labels):
+        pipeline = split.fit()
+        pca_train_result, pca_valid_result = split.pca_features(pipeline)
+
+        candidates = [('none', None, pipeline.model, 0.0)]
+        for method in methods:
+            for budget in budgets:
+                model, compress_time = timed(compress_svc, pipeline.model, pca_train_result, split.train_label,
+                                             budget, method)
+                candidates.append((method, budget, model, compress_time))
+
+        for method, budget, model, compress_time in candidates:
+            rows.append({'label': split.label, 'method': method, 'budget': budget,
+                         'n_support': len(model.support_vectors_), 'compress_seconds': compress_time,
+                         'rows_per_second': predictions_per_second(model, pca_valid_result),
+                         'accuracy': split.accuracy(model, pca_valid_result)})
+    return rows
+
+
+def main():
+    from reports import load_shared, print_table, report_parser
+
+    parser = report_parser('Benchmark support-vector compression of the label SVCs.', labels=[2, 4])
+    parser.add_argument('--methods', nargs='+', default=list(METHODS), choices=METHODS)
+    parser.add_argument('--budgets', type=float, nargs='+', default=[0.25, 0.5],
+                        help='support vectors to keep, or fractions below 1 of the support set')
+    args = parser.parse_args()
+
+    print_table(compare_compression(load_shared(args), args.labels, args.budgets, args.methods),
+                COMPRESSION_COLUMNS)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+# Per-stage timing telemetry for the label pipelines.
+#
+# The pipeline stages are wrapped in ``stage(...)`` blocks.  With telemetry off
+# (the default) a block costs one environment lookup.  Two environment
+# variables switch it on without editing code, also in the worker processes of
+# run_all_labels.py, which inherit the environment:
+#
+#   LAYER7_TELEMETRY     'stderr' or '1' to log to stderr, any other value is a
+#                        file that every process appends JSON lines to
+#   LAYER7_PROFILE_DIR   directory for a cProfile dump of every stage, named
+#                        <label>_<stage>_<pid>_<n>.prof (read with pstats/snakeviz)
+#
+# Each JSON line holds the stage, label, process id, start time, wall and CPU
+# seconds, row and column counts when the stage reports them, and the change of
+# the resident set size and of its peak over the stage.
+#
+# Usage (summarize a telemetry file per label and stage):
+#     python telemetry.py telemetry.jsonl
+
+import argparse
+import contextlib
+import cProfile
+import itertools
+import json
+import os
+import resource
+import sys
+import time
+
+TELEMETRY_ENV = 'LAYER7_TELEMETRY'
+PROFILE_DIR_ENV = 'LAYER7_PROFILE_DIR'
+
+# Numbers the profile dumps of a process, so repeated stages do not overwrite each other
+_profile_numbers = itertools.count()
+
+
+def enabled():
+    """Return whether stage records or profiles are being written."""
+    return bool(os.environ.get(TELEMETRY_ENV) or os.environ.get(PROFILE_DIR_ENV))
+
+
+def _rss_bytes():
+    # Current resident set size; /proc is Linux only, elsewhere fall back to the peak
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return _peak_rss_bytes()
+
+
+def _peak_rss_bytes():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def emit(record):
+    """Write one telemetry record as a JSON line to the configured destination."""
+    destination = os.environ.get(TELEMETRY_ENV)
+    if not destination:
+        return
+    line = json.dumps(record, default=str) + '\n'
+    if destination in ('1', 'stderr'):
+        sys.stderr.write(line)
+    else:
+        # One write per line keeps the records of concurrent workers whole
+        with open(destination, 'a') as f:
+            f.write(line)
+
+
+@contextlib.contextmanager
+def stage(name, label=None, rows=None, columns=None):
+    """Time the block as pipeline stage ``name``; the yielded dict takes extra fields such as row counts."""
+    if not enabled():
+        yield {}
+        return
+
+    record = {'stage': name, 'label': label, 'pid': os.getpid(), 'rows': rows, 'columns': columns}
+    profile_dir = os.environ.get(PROFILE_DIR_ENV)
+    profiler = cProfile.Profile() if profile_dir else None
+
+    rss = _rss_bytes()
+    peak_rss = _peak_rss_bytes()
+    record['started'] = time.time()
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield record
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        record['seconds'] = time.perf_counter() - start
+        record['cpu_seconds'] = time.process_time() - cpu_start
+        record['rss_delta_mb'] = (_rss_bytes() - rss) / 2 ** 20
+        record['peak_rss_delta_mb'] = (_peak_rss_bytes() - peak_rss) / 2 ** 20
+        if profiler is not None:
+            os.makedirs(profile_dir, exist_ok=True)
+            profile_path = os.path.join(profile_dir, '{}_{}_{}_{}.prof'.format(
+                'all' if label is None else label, name, os.getpid(), next(_profile_numbers)))
+            profiler.dump_stats(profile_path)
+            record['profile'] = profile_path
+        emit(record)
+
+
+def summarize(path):
+    """Return the total seconds and call count of every (label, stage) pair in a telemetry file."""
+    totals = {}
+    with open(path) as f:
+        for line in f:
+            record = json.loads(line)
+            key = (record['label'], record['stage'])
+            seconds, count = totals.get(key, (0.0, 0))
+            totals[key] = (seconds + record['seconds'], count + 1)
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Summarize a telemetry file per label and stage.')
+    parser.add_argument('path')
+    args = parser.parse_args()
+
+    totals = summarize(args.path)
+    print("{:>5} {:>12} {:>6} {:>10}".format('label', 'stage', 'calls', 'time (s)'))
+    for (label, name), (seconds, count) in sorted(totals.items(), key=lambda item: -item[1][0]):
+        print("{:>5} {:>12} {:>6} {:>10.3f}".format('-' if label is None else label, name, count, seconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+# Shared fixtures of the parity tests: a small synthetic split with the layer-7
+# layout, written by benchmark.make_dataset (null features, a label 2 with
+# missing values).
+
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+# The modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmark import make_dataset  # noqa: E402
+from shared_preprocessing import N_LABELS  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def dataset_paths(tmp_path_factory):
+    """Paths of a synthetic train, valid and test split."""
+    return make_dataset(400, 48, str(tmp_path_factory.mktemp('layer7')))
+
+
+@pytest.fixture(scope='session')
+def train_data(dataset_paths):
+    return pd.read_csv(dataset_paths[0])
+
+
+@pytest.fixture(scope='session')
+def train_features(train_data):
+    return train_data.iloc[:, :-N_LABELS]
+
+
+@pytest.fixture(scope='session')
+def train_labels(train_data):
+    return train_data.iloc[:, -N_LABELS:]
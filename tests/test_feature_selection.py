@@ -0,0 +1,44 @@
+# The vectorized feature selection must select exactly what the loops and
+# pandas calls of the label scripts selected.
+
+import numpy as np
+import pytest
+
+from feature_selection import correlation_with_target, find_correlated_features
+
+
+def loop_correlated_features(correlation_matrix, correlation_threshold):
+    """The nested loop of the label scripts."""
+    highly_correlated = set()
+    for i in range(len(correlation_matrix.columns)):
+        for j in range(i):
+            if abs(correlation_matrix.iloc[i, j]) > correlation_threshold:
+                highly_correlated.add(correlation_matrix.columns[i])
+    return highly_correlated
+
+
+@pytest.mark.parametrize('threshold', [0.3, 0.4, 0.5, 0.9])
+def test_correlated_features_match_the_loop(train_features, threshold):
+    features = train_features.copy()
+    # A constant feature has NaN correlations, which never exceed the threshold
+    features['constant'] = 1.0
+    correlation_matrix = features.corr()
+
+    found = find_correlated_features(correlation_matrix, threshold)
+    assert set(found) == loop_correlated_features(correlation_matrix, threshold)
+    # In column order, so the drop set is deterministic
+    assert found == [column for column in correlation_matrix.columns if column in found]
+
+
+def test_correlated_features_of_an_array(train_features):
+    correlation_matrix = train_features.corr()
+    columns = list(correlation_matrix.columns)
+    assert (find_correlated_features(correlation_matrix.to_numpy(), 0.4, columns)
+            == find_correlated_features(correlation_matrix, 0.4))
+
+
+@pytest.mark.parametrize('label', ['label_1', 'label_3', 'label_4'])
+def test_correlation_with_target_matches_corrwith(train_features, train_labels, label):
+    features = train_features.fillna(train_features.mean())
+    expected = features.corrwith(train_labels[label])
+    np.testing.assert_allclose(correlation_with_target(features, train_labels[label]), expected, rtol=1e-10)
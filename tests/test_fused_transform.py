@@ -0,0 +1,36 @@
+# The fused float32 projection must equal the scaler and PCA of the label
+# pipeline it was composed from.
+
+import numpy as np
+import pytest
+
+from feature_selection import find_correlated_features
+from fused_transform import FusedTransform
+from imputation import MeanImputer, labelled_rows
+from label_pipelines import LABEL_CONFIGS, LABELS, LabelPipeline
+
+
+@pytest.fixture(scope='module')
+def feature_block(train_features):
+    imputer = MeanImputer(train_features.columns).fit(train_features)
+    return imputer.transform(train_features, copy=True).to_numpy()
+
+
+@pytest.mark.parametrize('label', LABELS)
+def test_fused_transform_equals_scaler_and_pca(train_features, train_labels, feature_block, label):
+    labels = train_labels.iloc[:, label - 1].to_numpy()
+    rows = labelled_rows(labels)
+    correlated_features = find_correlated_features(train_features.corr(),
+                                                   LABEL_CONFIGS[label]['correlation_threshold'])
+    pipeline = LabelPipeline(label).fit(feature_block, labels[rows].astype(np.int64), list(train_features.columns),
+                                        correlated_features, rows=rows)
+
+    expected = pipeline.transform(feature_block)
+    fused = FusedTransform.from_pipeline(pipeline)
+    # The projection is stored in float32
+    tolerance = 1e-5 * np.abs(expected).max()
+    np.testing.assert_allclose(fused.transform(feature_block), expected, rtol=1e-4, atol=tolerance)
+
+    out = np.empty((len(feature_block), fused.n_components), dtype=np.float32)
+    assert fused.transform(feature_block, out=out) is out
+    np.testing.assert_allclose(out, expected, rtol=1e-4, atol=tolerance)
@@ -0,0 +1,38 @@
+# CachedKernelSVC must predict like SVC, and its clones must share the cache.
+
+import numpy as np
+import pytest
+from sklearn.base import clone
+from sklearn.model_selection import cross_val_score
+from sklearn.svm import SVC
+
+from kernel_cache import CachedKernelSVC, KernelCache
+
+
+@pytest.fixture(scope='module')
+def pca_like_features():
+    rng = np.random.default_rng(0)
+    return rng.normal(size=(300, 8)), rng.normal(size=(120, 8))
+
+
+@pytest.mark.parametrize('n_classes', [2, 3, 6])
+@pytest.mark.parametrize('shape', ['ovr', 'ovo'])
+def test_cached_kernel_svc_matches_svc(pca_like_features, n_classes, shape):
+    X, X_new = pca_like_features
+    y = np.digitize(X[:, 0] + X[:, 1], np.quantile(X[:, 0] + X[:, 1], np.linspace(0, 1, n_classes + 1)[1:-1]))
+
+    expected = SVC(C=10, decision_function_shape=shape).fit(X, y)
+    model = CachedKernelSVC(C=10, decision_function_shape=shape, cache=KernelCache()).fit(X, y)
+    np.testing.assert_array_equal(model.predict(X_new), expected.predict(X_new))
+    np.testing.assert_allclose(model.decision_function(X_new), expected.decision_function(X_new), atol=1e-6)
+
+
+def test_clones_share_the_cache(pca_like_features):
+    X, _ = pca_like_features
+    y = (X[:, 0] > 0).astype(int)
+    cache = KernelCache()
+    model = CachedKernelSVC(cache=cache)
+
+    assert clone(model).cache is cache
+    cross_val_score(model, X, y, cv=3)
+    assert len(cache) == 3
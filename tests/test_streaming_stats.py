@@ -0,0 +1,40 @@
+# The single-pass streaming statistics must match the in-memory pandas
+# computation of the label scripts, whatever the chunk size and input format.
+
+import numpy as np
+import pytest
+
+from binary_dataset import convert_csv
+from streaming_stats import compute_streaming_stats
+
+
+@pytest.fixture(scope='module')
+def binary_train_path(dataset_paths, tmp_path_factory):
+    out_dir = str(tmp_path_factory.mktemp('binary') / 'train')
+    convert_csv(dataset_paths[0], out_dir)
+    return out_dir
+
+
+@pytest.mark.parametrize('chunksize', [37, 400])
+def test_streaming_stats_match_pandas(dataset_paths, train_features, train_labels, chunksize):
+    stats = compute_streaming_stats(dataset_paths[0], chunksize=chunksize)
+    means = train_features.mean()
+    imputed = train_features.fillna(means)
+
+    np.testing.assert_allclose(stats.means, means, rtol=1e-12)
+    np.testing.assert_allclose(stats.imputer().means_, means, rtol=1e-12)
+    np.testing.assert_allclose(stats.covariance(), imputed.cov(), rtol=1e-10, atol=1e-12)
+    np.testing.assert_allclose(stats.correlation(), imputed.corr(), rtol=1e-10, atol=1e-12)
+    # Rows with a missing label 2 are left out of its correlations
+    for label in train_labels.columns:
+        np.testing.assert_allclose(stats.label_correlation()[label], imputed.corrwith(train_labels[label]),
+                                   rtol=1e-10, atol=1e-12)
+
+
+def test_streaming_stats_of_a_binary_dataset(binary_train_path, train_features):
+    # The binary format stores float32 features
+    features = train_features.astype(np.float32).astype(np.float64)
+    stats = compute_streaming_stats(binary_train_path, chunksize=50)
+
+    np.testing.assert_allclose(stats.means, features.mean(), rtol=1e-12)
+    np.testing.assert_allclose(stats.correlation(), features.fillna(features.mean()).corr(), rtol=1e-10, atol=1e-12)